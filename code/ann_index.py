@@ -0,0 +1,102 @@
+# ann_index.py — Flat / IVF / HNSW FAISS index builders with auto selection
+
+import os
+
+import numpy as np
+
+# "auto" picks from the vector count; "flat" | "ivf" | "hnsw" force a family
+INDEX_TYPE = os.getenv("BOOKCHAT_INDEX_TYPE", "auto")
+
+# Search-time knobs (applied whenever an index is loaded)
+IVF_NPROBE     = int(os.getenv("BOOKCHAT_NPROBE", "16"))
+HNSW_EF_SEARCH = int(os.getenv("BOOKCHAT_EF_SEARCH", "64"))
+
+# Build-time knobs
+HNSW_M               = 32
+HNSW_EF_CONSTRUCTION = 80
+IVF_TRAIN_PER_LIST   = 64      # training sample = nlist * this, capped by n
+
+# Thresholds used by "auto" — measured with benchmarks/ann_report.py (Readme)
+FLAT_MAX_VECTORS = 50_000       # exact search is still under ~8 ms per query here
+HNSW_MAX_VECTORS = 150_000      # by 200k, IVF (nprobe 16) beats HNSW (ef 64) on recall and latency
+
+
+def choose_index_type(n_vectors: int) -> str:
+    if n_vectors <= FLAT_MAX_VECTORS:
+        return "flat"
+    if n_vectors <= HNSW_MAX_VECTORS:
+        return "hnsw"
+    return "ivf"
+
+
+def ivf_nlist(n_vectors: int) -> int:
+    """Rule of thumb: ~4·sqrt(n) lists, at least 1 and never more than n (training needs a point per list)."""
+    return max(1, min(n_vectors, int(4 * np.sqrt(n_vectors))))
+
+
+def build_index(vectors: np.ndarray, kind: str = INDEX_TYPE, seed: int = 0):
+    """Build a FAISS L2 index of the given family over vectors (n, d) float32."""
+    import faiss
+
+    vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+    n, d    = vectors.shape
+    if kind == "auto":
+        kind = choose_index_type(n)
+
+    if kind == "flat":
+        index = faiss.IndexFlatL2(d)
+
+    elif kind == "hnsw":
+        index = faiss.IndexHNSWFlat(d, HNSW_M)
+        index.hnsw.efConstruction = HNSW_EF_CONSTRUCTION
+
+    elif kind == "ivf":
+        nlist     = ivf_nlist(n)
+        quantizer = faiss.IndexFlatL2(d)
+        index     = faiss.IndexIVFFlat(quantizer, d, nlist)
+        # Train on a random sample rather than the whole corpus
+        rng    = np.random.default_rng(seed)
+        sample = min(n, nlist * IVF_TRAIN_PER_LIST)
+        index.train(vectors[rng.choice(n, size=sample, replace=False)])
+
+    else:
+        raise ValueError(f"Unknown index type: {kind}")
+
+    if n:
+        index.add(vectors)
+    tune_search(index)
+    return index
+
+
+def tune_search(index, nprobe: int = IVF_NPROBE, ef_search: int = HNSW_EF_SEARCH):
+    """Apply search-time parameters for whichever family this index is."""
+    import faiss
+
+    base = faiss.downcast_index(index)
+    if isinstance(base, faiss.IndexIVF):
+        base.nprobe = min(nprobe, base.nlist)
+    elif isinstance(base, faiss.IndexHNSW):
+        base.hnsw.efSearch = ef_search
+    return index
+
+
+def index_kind(index) -> str:
+    import faiss
+
+    base = faiss.downcast_index(index)
+    if isinstance(base, faiss.IndexIVF):
+        return "ivf"
+    if isinstance(base, faiss.IndexHNSW):
+        return "hnsw"
+    return "flat"
+
+
+def all_vectors(index) -> np.ndarray:
+    """Every stored vector, in position order (used to rebuild as another type)."""
+    if index.ntotal == 0:
+        return np.zeros((0, index.d), dtype=np.float32)
+    if index_kind(index) == "ivf":
+        # IVF needs a direct map before vectors can be reconstructed by position
+        import faiss
+        faiss.extract_index_ivf(index).make_direct_map()
+    return index.reconstruct_n(0, index.ntotal)
@@ -0,0 +1,232 @@
+# answer_cache.py — Persistent exact-match and semantic answer caches (SQLite)
+
+import os
+import sqlite3
+import threading
+import time
+
+import numpy as np
+
+from embedding_cache import CACHE_DIR, chunk_hash, normalize_query
+
+ANSWER_CACHE_PATH = os.path.join(CACHE_DIR, "answers.sqlite3")
+ANSWER_CACHE_TTL  = float(os.getenv("BOOKCHAT_ANSWER_CACHE_TTL", str(7 * 24 * 3600)))
+ANSWER_CACHE_MAX  = int(os.getenv("BOOKCHAT_ANSWER_CACHE_MAX", "10000"))
+
+
+class AnswerCache:
+    """
+    (index content hash, normalized question, prompt version) → answer.
+    Entries expire after `ttl` seconds; past `max_rows` the least recently
+    used are evicted.
+    """
+
+    def __init__(self, path: str = ANSWER_CACHE_PATH,
+                 ttl: float = ANSWER_CACHE_TTL, max_rows: int = ANSWER_CACHE_MAX):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.ttl      = ttl
+        self.max_rows = max_rows
+        self.hits     = 0
+        self.misses   = 0
+        self._conn    = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS answers ("
+            " index_key TEXT NOT NULL, question TEXT NOT NULL, prompt_version TEXT NOT NULL,"
+            " answer TEXT NOT NULL, created REAL NOT NULL, used REAL NOT NULL,"
+            " PRIMARY KEY (index_key, question, prompt_version))"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS answers_used ON answers (used)")
+        self._conn.commit()
+        self._lock = threading.Lock()
+
+    def get(self, index_key: str, question: str, prompt_version: str):
+        key = (index_key, normalize_query(question), prompt_version)
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT answer, created FROM answers"
+                " WHERE index_key = ? AND question = ? AND prompt_version = ?", key
+            ).fetchone()
+            if row and now - row[1] < self.ttl:
+                self._conn.execute(
+                    "UPDATE answers SET used = ?"
+                    " WHERE index_key = ? AND question = ? AND prompt_version = ?", (now, *key)
+                )
+                self._conn.commit()
+                self.hits += 1
+                return row[0]
+            self.misses += 1
+            return None
+
+    def put(self, index_key: str, question: str, prompt_version: str, answer: str):
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO answers VALUES (?, ?, ?, ?, ?, ?)",
+                (index_key, normalize_query(question), prompt_version, answer, now, now),
+            )
+            self._evict(now)
+            self._conn.commit()
+
+    def _evict(self, now: float):
+        self._conn.execute("DELETE FROM answers WHERE created < ?", (now - self.ttl,))
+        (count,) = self._conn.execute("SELECT COUNT(*) FROM answers").fetchone()
+        if count > self.max_rows:
+            self._conn.execute(
+                "DELETE FROM answers WHERE rowid IN"
+                " (SELECT rowid FROM answers ORDER BY used LIMIT ?)", (count - self.max_rows,)
+            )
+
+    def stats(self) -> dict:
+        with self._lock:
+            (rows,) = self._conn.execute("SELECT COUNT(*) FROM answers").fetchone()
+            return {"hits": self.hits, "misses": self.misses, "entries": rows}
+
+
+# =========================
+# SEMANTIC ANSWER CACHE
+# Near-duplicate questions ("who is the narrator" / "who narrates the
+# story") reuse a stored answer when their embeddings are close AND
+# retrieval returned the same passages, so the answer is grounded in the
+# same context. Every semantic hit is written to an audit table.
+# =========================
+
+SEMANTIC_THRESHOLD = float(os.getenv("BOOKCHAT_SEMANTIC_THRESHOLD", "0.92"))
+SEMANTIC_MAX_PER_SCOPE = int(os.getenv("BOOKCHAT_SEMANTIC_MAX", "256"))
+
+
+def context_signature(docs) -> str:
+    """Order-independent id of a retrieved context set."""
+    ids = sorted(getattr(d, "id", None) or chunk_hash(d.page_content) for d in docs)
+    return chunk_hash("\n".join(ids))
+
+
+class SemanticAnswerCache:
+    """
+    Per scope, a small in-memory matrix of normalized question embeddings
+    (loaded lazily from SQLite) searched by cosine similarity.
+    """
+
+    def __init__(self, path: str = ANSWER_CACHE_PATH,
+                 threshold: float = SEMANTIC_THRESHOLD,
+                 max_per_scope: int = SEMANTIC_MAX_PER_SCOPE,
+                 ttl: float = ANSWER_CACHE_TTL):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.threshold     = threshold
+        self.max_per_scope = max_per_scope
+        self.ttl           = ttl
+        self.hits          = 0
+        self.misses        = 0
+        self.evictions     = 0
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS semantic ("
+            " id INTEGER PRIMARY KEY, scope TEXT NOT NULL, prompt_version TEXT NOT NULL,"
+            " question TEXT NOT NULL, vec BLOB NOT NULL, context TEXT NOT NULL,"
+            " answer TEXT NOT NULL, created REAL NOT NULL, used REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS semantic_scope ON semantic (scope, prompt_version)")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS semantic_audit ("
+            " id INTEGER PRIMARY KEY, entry INTEGER, scope TEXT, asked TEXT, matched TEXT,"
+            " similarity REAL, at REAL, false_hit INTEGER DEFAULT 0)"
+        )
+        self._conn.commit()
+        self._lock   = threading.Lock()
+        self._scopes = {}    # (scope, prompt_version) -> (row ids, matrix, contexts)
+
+    def _load(self, scope: str, prompt_version: str):
+        key = (scope, prompt_version)
+        if key not in self._scopes:
+            rows = self._conn.execute(
+                "SELECT id, vec, context FROM semantic WHERE scope = ? AND prompt_version = ?"
+                " AND created >= ?", (scope, prompt_version, time.time() - self.ttl)
+            ).fetchall()
+            ids    = [r[0] for r in rows]
+            matrix = (np.vstack([np.frombuffer(r[1], dtype=np.float32) for r in rows])
+                      if rows else None)
+            self._scopes[key] = (ids, matrix, [r[2] for r in rows])
+        return self._scopes[key]
+
+    def get(self, scope: str, prompt_version: str, question: str,
+            vector, context: str):
+        """Return (answer, audit_id) for a close enough question with the same context."""
+        q = _unit(vector)
+        with self._lock:
+            ids, matrix, contexts = self._load(scope, prompt_version)
+            if matrix is not None:
+                sims = matrix @ q
+                for n in np.argsort(-sims):
+                    if sims[n] < self.threshold:
+                        break
+                    if contexts[n] != context:
+                        continue
+                    answer, matched = self._conn.execute(
+                        "SELECT answer, question FROM semantic WHERE id = ?", (ids[n],)
+                    ).fetchone()
+                    now = time.time()
+                    self._conn.execute("UPDATE semantic SET used = ? WHERE id = ?", (now, ids[n]))
+                    audit = self._conn.execute(
+                        "INSERT INTO semantic_audit (entry, scope, asked, matched, similarity, at)"
+                        " VALUES (?, ?, ?, ?, ?, ?)",
+                        (ids[n], scope, question, matched, float(sims[n]), now),
+                    ).lastrowid
+                    self._conn.commit()
+                    self.hits += 1
+                    return answer, audit
+            self.misses += 1
+            return None, None
+
+    def put(self, scope: str, prompt_version: str, question: str,
+            vector, context: str, answer: str):
+        q   = _unit(vector)
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO semantic (scope, prompt_version, question, vec, context, answer, created, used)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (scope, prompt_version, normalize_query(question), q.tobytes(), context, answer, now, now),
+            )
+            # Least recently used entries beyond the per-scope bound
+            stale = self._conn.execute(
+                "SELECT id FROM semantic WHERE scope = ? AND prompt_version = ?"
+                " ORDER BY used DESC LIMIT -1 OFFSET ?", (scope, prompt_version, self.max_per_scope)
+            ).fetchall()
+            if stale:
+                self._conn.executemany("DELETE FROM semantic WHERE id = ?", stale)
+                self.evictions += len(stale)
+            self._conn.commit()
+            self._scopes.pop((scope, prompt_version), None)
+
+    def flag_false_hit(self, audit_id: int):
+        """A reader said the served answer didn't fit: mark the audit row and drop the entry."""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT entry, scope FROM semantic_audit WHERE id = ?", (audit_id,)
+            ).fetchone()
+            if not row:
+                return
+            self._conn.execute("UPDATE semantic_audit SET false_hit = 1 WHERE id = ?", (audit_id,))
+            self._conn.execute("DELETE FROM semantic WHERE id = ?", (row[0],))
+            self._conn.commit()
+            self._scopes = {k: v for k, v in self._scopes.items() if k[0] != row[1]}
+
+    def stats(self) -> dict:
+        with self._lock:
+            audited, false_hits = self._conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(false_hit), 0) FROM semantic_audit"
+            ).fetchone()
+            return {
+                "hits":       self.hits,
+                "misses":     self.misses,
+                "evictions":  self.evictions,
+                "audited":    audited,
+                "false_hits": false_hits,
+            }
+
+
+def _unit(vector) -> np.ndarray:
+    v = np.asarray(vector, dtype=np.float32)
+    return v / max(float(np.linalg.norm(v)), 1e-12)
@@ -1,10 +1,28 @@
 import streamlit as st
-from PyPDF2 import PdfReader
-from langchain_text_splitters import RecursiveCharacterTextSplitter
-import os
-
-from book_loader import download_book
-from langchain_google_genai import ChatGoogleGenerativeAI
+import asyncio
+import bisect
+import hashlib
+import queue
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from book_loader import open_book_text, stream_book
+from book_renderer import locate_offset
+from chunker import iter_structured_chunks
+from answer_cache import AnswerCache, SemanticAnswerCache
+from ask_pipeline import AskPipeline, QuestionRunner, Target
+from llm_backends import backend_id, backend_stats, get_llm
+from reranker import RERANK_ENABLED, Reranker
+from embedding_cache import CachedEmbeddings
+from ingest import EMBED_BATCH_SIZE, EMBED_WORKERS, PooledEmbeddings
+from pdf_extract import iter_pdf_pages
+from lexical_index import LexicalIndexBuilder, get_lexical
+from retrieval import FETCH_K
+from library_index import LIBRARY_SOURCE, book_id_from_url, chunk_metadata, get_library, library_key
+from index_store import (content_hash, delete_index, has_index, index_path, save_index, load_index, get_index,
+                         read_documents, remove_documents, lookup_source, remember_source,
+                         cache_stats as index_cache_stats)
 from langchain_community.vectorstores import FAISS
 from langchain_core.prompts import PromptTemplate
 from langchain_classic.chains.combine_documents import create_stuff_documents_chain
@@ -40,70 +58,337 @@ init_state()
 
 # =========================
 # EMBEDDINGS CACHE
+# Chunk vectors are also cached on disk by (model, chunk hash), so
+# re-indexing text we've seen before does no model inference at all.
 # =========================
 
+EMBEDDING_MODEL = "all-MiniLM-L6-v2"
+
 @st.cache_resource
 def load_embeddings():
-    return HuggingFaceEmbeddings(model_name="all-MiniLM-L6-v2")
+    # Cache misses are embedded in batches across a worker pool
+    pooled = PooledEmbeddings(
+        HuggingFaceEmbeddings(model_name=EMBEDDING_MODEL),
+        model_name=EMBEDDING_MODEL,
+    )
+    return CachedEmbeddings(pooled, model_name=EMBEDDING_MODEL)
 
 
 # =========================
-# PDF TEXT
+# TEXT CHUNKS
 # =========================
 
-def get_pdf_text(pdf_docs):
-    text = ""
-    for pdf in pdf_docs:
-        reader = PdfReader(pdf)
-        for page in reader.pages:
-            extracted = page.extract_text()
-            if extracted:
-                text += extracted
-    return text
+def iter_text_chunks(pieces):
+    """
+    Chunk a stream of text pieces along chapter and paragraph boundaries,
+    yielding (chunk, metadata) as soon as each chunk is complete. Only a
+    few chunks' worth of text is held at any time.
+    """
+    return iter_structured_chunks(pieces)
+
+
+def iter_page_chunks(pages):
+    """
+    Like iter_text_chunks, for (source, page_number, text) triples from
+    iter_pdf_pages. Metadata also carries the source file and the page
+    each chunk starts on.
+    """
+    starts, where = [], []     # where[i] = (source, page) starting at offset starts[i]
+
+    def pieces():
+        offset = 0
+        for source, page, text in pages:
+            if not text:
+                continue
+            starts.append(offset)
+            where.append((source, page))
+            offset += len(text) + 1
+            yield text + "\n"
+
+    for chunk, meta in iter_structured_chunks(pieces()):
+        source, page = where[max(bisect.bisect_right(starts, meta["start"]) - 1, 0)]
+        yield chunk, {**meta, "source": source, "page": page}
 
 
 # =========================
-# TEXT CHUNKS
+# VECTOR STORE
 # =========================
 
-def get_text_chunks(text):
-    splitter = RecursiveCharacterTextSplitter(
-        chunk_size=5000,
-        chunk_overlap=500
-    )
-    return splitter.split_text(text)
+def active_index_key():
+    book = st.session_state.get("active_book") or {}
+    key  = book.get("index_key")
+    return key if has_index(key) else None
 
 
 # =========================
-# VECTOR STORE
+# LOAD BOOK FROM WEB
+# NOTE: indexes are stored per book under indexes/<content hash>, and the
+# URL → key map lets a previously loaded book skip download & indexing.
+# Download → clean → chunk runs on a background thread and feeds the
+# embedder through a small queue, so embedding overlaps the transfer.
 # =========================
 
-def get_vector_store(chunks):
+# Chunks per streamed embedding call. With a worker pool, a call must hold
+# two pool batches or PooledEmbeddings keeps it on the in-process model
+STREAM_EMBED_BATCH = 2 * EMBED_BATCH_SIZE if EMBED_WORKERS > 1 else 32
+# Embedding calls in flight while chunks keep streaming in — enough for
+# every pool worker to have a batch
+STREAM_EMBED_INFLIGHT = max(1, EMBED_WORKERS // 2)
+
+def _prefetch(gen, maxsize: int = 4):
+    """
+    Run a generator on a background thread, yielding through a bounded queue.
+    If the consumer stops early, the producer gives up within a second and
+    closes gen, so its download and book .part file are released.
+    """
+    q    = queue.Queue(maxsize=maxsize)
+    done = object()
+    stop = threading.Event()
+
+    def put(item) -> bool:
+        while not stop.is_set():
+            try:
+                q.put(item, timeout=0.5)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def produce():
+        try:
+            for item in gen:
+                if not put(item):
+                    return
+            put(done)
+        except BaseException as e:
+            put(e)
+        finally:
+            gen.close()
+
+    threading.Thread(target=produce, daemon=True).start()
+    try:
+        while True:
+            item = q.get()
+            if item is done:
+                return
+            if isinstance(item, BaseException):
+                raise item
+            yield item
+    finally:
+        stop.set()
+
+
+def _embed_into(db, batch, vectors, embeddings, ids=None):
+    texts = [t for t, _ in batch]
+    metas = [m for _, m in batch]
+    pairs = list(zip(texts, vectors))
+    if db is None:
+        return FAISS.from_embeddings(pairs, embeddings, metadatas=metas, ids=ids)
+    db.add_embeddings(pairs, metadatas=metas, ids=ids)
+    return db
+
+
+def _index_chunks(chunks, db=None, id_prefix: str = "c", lexical=None):
+    """
+    Embed a stream of (text, metadata) chunks in batches as they arrive,
+    appending to db if given. Chunks get docstore ids "<prefix>:<n>";
+    returns (db, ids). If a LexicalIndexBuilder is given, each chunk is
+    added to it as well, so BM25 postings are built in the same pass.
+    """
     embeddings = load_embeddings()
-    db = FAISS.from_texts(chunks, embedding=embeddings)
-    db.save_local("faiss_index")
+    batch, ids = [], []
+    pending    = deque()     # (batch, ids, future) in submission order
+
+    def submit(pool, batch):
+        batch_ids = [f"{id_prefix}:{len(ids) + n}" for n in range(len(batch))]
+        ids.extend(batch_ids)
+        if lexical is not None:
+            for doc_id, (text, _) in zip(batch_ids, batch):
+                lexical.add(doc_id, text)
+        future = pool.submit(embeddings.embed_documents, [t for t, _ in batch])
+        pending.append((batch, batch_ids, future))
+
+    def collect(db):
+        batch, batch_ids, future = pending.popleft()
+        return _embed_into(db, batch, future.result(), embeddings, ids=batch_ids)
+
+    # Batches are embedded in the background, so several keep the pool busy
+    # while the next chunks stream in; they join db in order
+    with ThreadPoolExecutor(max_workers=STREAM_EMBED_INFLIGHT, thread_name_prefix="embed") as pool:
+        for chunk in chunks:
+            batch.append(chunk)
+            if len(batch) >= STREAM_EMBED_BATCH:
+                submit(pool, batch)
+                batch = []
+            while pending and (len(pending) > STREAM_EMBED_INFLIGHT or pending[0][2].done()):
+                db = collect(db)
+        if batch:
+            submit(pool, batch)
+        while pending:
+            db = collect(db)
+    return db, ids
+
+
+def load_book_from_web(url: str) -> str:
+    """Download, chunk, and index a Gutenberg book. Returns its index key."""
+    key = lookup_source(url)
+    if key:
+        return key
+
+    digest = hashlib.sha256()
+
+    def pieces():
+        for piece in stream_book(url):
+            digest.update(piece.encode("utf-8"))
+            yield piece
+
+    doc_id  = book_id_from_url(url)
+    chunks  = ((c, {**meta, "doc_id": doc_id, "source": url})
+               for c, meta in _prefetch(iter_text_chunks(pieces())))
+    lexical = LexicalIndexBuilder()
+    db, _   = _index_chunks(chunks, lexical=lexical)
+
+    # Same key content_hash(text) would give for the joined text
+    key = digest.hexdigest()[:32]
+    save_index(db, key, lexical=lexical)
+    remember_source(url, key)
+    return key
 
 
 # =========================
-# LOAD BOOK FROM WEB
-# NOTE: @st.cache_data caches by URL — same URL returns instantly.
-# When a NEW book is selected the URL changes so it re-downloads & re-indexes.
+# LOAD UPLOADED PDFS
+# Pages are extracted in parallel and streamed straight into the chunker
+# and embedder, so a long upload never sits in memory as one string.
+# Each file is its own document inside the index: changing the selection
+# starts from the previous index, drops removed files and embeds only the
+# new ones.
 # =========================
 
-@st.cache_data(show_spinner=False)
-def load_book_from_web(url: str) -> int:
-    """Download, chunk, and index a Gutenberg book. Returns chunk count."""
-    text   = download_book(url)
-    chunks = get_text_chunks(text)
-    get_vector_store(chunks)
-    return len(chunks)
+def index_pdfs(pdf_docs, progress=None, base_key: str = None) -> str:
+    """Index uploaded PDFs (or reuse their saved index). Returns the index key."""
+    files = {content_hash(p.getvalue()): p for p in pdf_docs}
+    # Same set of files → same key → reuse the saved index
+    key = content_hash(",".join(sorted(files)))
+    if has_index(key):
+        return key
+
+    db, documents, lexical = None, {}, None
+    if base_key and has_index(base_key):
+        # Fresh copy — the cached store is shared with other sessions
+        db        = load_index(base_key, load_embeddings())
+        documents = read_documents(base_key)
+        removed   = [d for d in documents if d not in files]
+        dropped   = {i for d in removed for i in documents[d]}
+        remove_documents(db, documents, removed)
+        # Kept chunks keep their saved postings; only new files are tokenized
+        lexical = LexicalIndexBuilder.from_saved(index_path(base_key), skip=dropped)
+    if lexical is None:
+        lexical = LexicalIndexBuilder()
+        if db is not None:
+            lexical.add_from_store(db)    # saved before lexical indexes existed
+
+    for doc_id, pdf in files.items():
+        if doc_id in documents:
+            continue
+        # Extraction already runs ahead in the worker pool; the progress
+        # callback touches st widgets, so it must stay on the script thread
+        pages = iter_pdf_pages([pdf], progress=progress)
+        chunks = ((c, {**meta, "doc_id": doc_id}) for c, meta in iter_page_chunks(pages))
+        db, documents[doc_id] = _index_chunks(chunks, db=db, id_prefix=doc_id, lexical=lexical)
+
+    if db is None or not any(documents.values()):
+        raise Exception("No text could be extracted from these PDFs.")
+    save_index(db, key, documents=documents, lexical=lexical)
+    if base_key and base_key != key and has_index(base_key):
+        # The new selection's index supersedes the one it was built from
+        delete_index(base_key)
+    return key
+
+
+# =========================
+# LIBRARY INDEX
+# One store over every catalogue book, each chunk tagged with book id,
+# author, genre and position, so questions can span books. Building it
+# only ingests books the current library doesn't have yet.
+# =========================
+
+def build_library(catalogue, progress=None) -> str:
+    """Add any missing catalogue books to the library index. Returns its key."""
+    base       = library_key()
+    embeddings = load_embeddings()
+    db         = load_index(base, embeddings) if base else None
+    documents  = read_documents(base) if base else {}
+    # Books already in the library keep their saved postings; only new ones are tokenized
+    lexical    = LexicalIndexBuilder.from_saved(index_path(base)) if base else None
+    if lexical is None:
+        lexical = LexicalIndexBuilder()
+        if db is not None:
+            lexical.add_from_store(db)    # saved before lexical indexes existed
+
+    todo = [b for b in catalogue if book_id_from_url(b["url"]) not in documents]
+    for n, book in enumerate(todo, 1):
+        chunks = _prefetch(iter_text_chunks(stream_book(book["url"])))
+        tagged = ((c, {**meta, **chunk_metadata(book, i), "doc_id": book_id_from_url(book["url"])})
+                  for i, (c, meta) in enumerate(chunks))
+        db, documents[book_id_from_url(book["url"])] = _index_chunks(
+            tagged, db=db, id_prefix=book_id_from_url(book["url"]), lexical=lexical
+        )
+        if progress:
+            progress(n, len(todo), book["title"])
+
+    if not todo:
+        return base
+    key = content_hash(",".join(sorted(documents)))
+    save_index(db, key, documents=documents, lexical=lexical)
+    remember_source(LIBRARY_SOURCE, key)
+    if base and base != key:
+        # Superseded: every later lookup resolves the library to the new key
+        delete_index(base)
+    return key
+
+
+def retrieval_scope_key() -> str:
+    """What a cached answer depends on: the index content plus the search scope."""
+    scope = st.session_state.get("scope", "book")
+    if scope == "book":
+        return active_index_key()
+    book = st.session_state.get("active_book") or {}
+    return f"{library_key()}|{scope}|{book.get('author', '') if scope == 'author' else ''}"
+
+
+def retrieval_target() -> Target:
+    """
+    What the session's questions are answered from: the active index, or
+    the library filtered to this book's author / the whole shelf. Dense
+    and BM25 rankings are fused with reciprocal rank fusion, so exact
+    names and quotes surface even when MiniLM ranks them low.
+    """
+    scope = st.session_state.get("scope", "book")
+    book  = st.session_state.get("active_book") or {}
+    lib   = get_library(load_embeddings()) if scope != "book" else None
+
+    if lib is None:
+        key = active_index_key()
+        return Target(key, get_index(key, load_embeddings()), get_lexical(index_path(key)))
+
+    filters = {"author": book.get("author") if scope == "author" else None}
+    return Target(
+        retrieval_scope_key(), lib.db, get_lexical(index_path(lib.key)),
+        dense=lambda q: lib.search(q, k=FETCH_K, **filters),
+        allowed=lib.allowed_ids(**filters),
+    )
 
 
 # =========================
 # AI CHAIN
+# Bump PROMPT_VERSION whenever the prompt changes, so cached answers from
+# the old prompt are no longer served. The backend and model are part of
+# it too (BOOKCHAT_LLM_BACKEND, see llm_backends.py).
 # =========================
 
-def get_chain():
+PROMPT_VERSION = f"1|{backend_id()}"
+
+def get_chain(model=None):
     prompt_template = """
 You are an expert literary assistant helping readers understand and explore books.
 Answer questions using ONLY the provided context from the book.
@@ -121,10 +406,7 @@ Question:
 
 Answer:
 """
-    model = ChatGoogleGenerativeAI(
-        model="gemini-1.5-flash",
-        temperature=0.3
-    )
+    model = model or get_llm()
     prompt = PromptTemplate(
         template=prompt_template,
         input_variables=["context", "input"]
@@ -135,35 +417,142 @@ Answer:
 
 
 # =========================
-# ASK QUESTION
-# FIX: chain.invoke() returns a plain string, not a dict
+# ANSWER CACHE
+# Repeat questions (e.g. the suggested ones) on the same index are
+# answered from disk with no retrieval or LLM call.
 # =========================
 
-def ask_question(question: str) -> str:
-    if not os.path.exists("faiss_index"):
-        return "No book is loaded yet. Please load a book from the library or upload a PDF."
+@st.cache_resource
+def load_answer_cache():
+    return AnswerCache()
 
-    embeddings = load_embeddings()
-    db = FAISS.load_local(
-        "faiss_index",
-        embeddings,
-        allow_dangerous_deserialization=True
-    )
 
-    docs   = db.similarity_search(question, k=4)
-    chain  = get_chain()
+@st.cache_resource
+def load_semantic_cache():
+    return SemanticAnswerCache()
+
 
-    # invoke returns a str directly — NOT a dict
-    answer = chain.invoke({"context": docs, "input": question})
+def get_cache_stats() -> dict:
+    """Hit/miss counters of every cache layer, for the sidebar."""
+    return {
+        "Answers":          load_answer_cache().stats(),
+        "Similar questions": load_semantic_cache().stats(),
+        "Query embeddings": load_embeddings().queries.stats(),
+        "Loaded indexes":   index_cache_stats(),
+    }
 
-    # If somehow a dict slips through, handle gracefully
-    if isinstance(answer, dict):
-        answer = answer.get("answer") or answer.get("output") or str(answer)
+
+# =========================
+# ASK QUESTION
+# FIX: chain.invoke() returns a plain string, not a dict
+# =========================
+
+@st.cache_resource
+def load_reranker():
+    if not RERANK_ENABLED:
+        return None
+    reranker = Reranker()
+    reranker.warm_up()
+    return reranker
+
+
+@st.cache_resource
+def load_pipeline():
+    return AskPipeline(load_embeddings(), load_answer_cache(), load_semantic_cache(),
+                       get_chain, PROMPT_VERSION, reranker=load_reranker())
+
+
+def stream_answer(question: str, use_cache: bool = True):
+    """
+    Yield the answer as it is generated. Cached answers arrive as a single
+    piece. While the LLM streams, the text so far is kept in session state
+    so it survives the user navigating away (see recover_partial_answer).
+    The full answer is added to chat_history once the stream completes.
+    Asking again while an answer is still streaming cancels the old one.
+    """
+    key = active_index_key()
+    if not key:
+        yield "No book is loaded yet. Please load a book from the library or upload a PDF."
+        return
+
+    runner  = st.session_state.setdefault("_runner", QuestionRunner())
+    partial = st.session_state["_partial_answer"] = {"question": question, "parts": []}
+    st.session_state["_semantic_audit"] = None
+    st.session_state["_last_timing"]    = None
+    st.session_state["_last_sources"]   = None
+
+    info = None
+    try:
+        for event, info in runner.stream(load_pipeline().astream(question, retrieval_target(), use_cache)):
+            if event == "token":
+                partial["parts"].append(info)
+                yield info
+    except asyncio.TimeoutError:
+        st.session_state.pop("_partial_answer", None)
+        yield "⏱️ The answer took too long to arrive. Please try again in a moment."
+        return
+
+    if not isinstance(info, dict):
+        # Cancelled by a newer question before the final event: that one owns the history now
+        return
+    answer = info["answer"]
+    st.session_state["_last_sources"] = info.get("sources")
+    if info["source"] == "llm":
+        st.session_state["_last_timing"] = {"ttft": info["ttft"], "total": info["total"],
+                                            "context_tokens": info["context_tokens"]}
+    else:
+        st.session_state["_semantic_audit"] = info.get("audit_id")
+        yield answer
+    st.session_state.pop("_partial_answer", None)
 
     st.session_state.chat_history.append(("User", question))
     st.session_state.chat_history.append(("Bot", answer))
 
-    return answer
+
+def ask_question(question: str, use_cache: bool = True) -> str:
+    """Non-streaming form of stream_answer — blocks until the full answer is ready."""
+    return "".join(stream_answer(question, use_cache=use_cache))
+
+
+def recover_partial_answer():
+    """
+    A rerun (e.g. navigating away) stops the script mid-stream; keep what
+    had arrived so far in the chat history instead of losing it.
+    """
+    partial = st.session_state.pop("_partial_answer", None)
+    if partial and partial["parts"]:
+        st.session_state.chat_history.append(("User", partial["question"]))
+        st.session_state.chat_history.append(("Bot", "".join(partial["parts"]) + " …*(interrupted)*"))
+
+
+def reject_cached_answer() -> str:
+    """
+    The reader says the last answer (served from a similar question)
+    doesn't fit: record the false hit and ask again without caches.
+    """
+    audit_id = st.session_state.get("_semantic_audit")
+    history  = st.session_state.chat_history
+    if not audit_id or len(history) < 2:
+        return None
+    load_semantic_cache().flag_false_hit(audit_id)
+    question = history[-2][1]
+    del history[-2:]
+    return ask_question(question, use_cache=False)
+
+
+def locate_passage(meta: dict) -> dict:
+    """
+    Where a retrieved chunk sits in the book viewer: {"batch", "page"}
+    from its stored start offset, or None for chunks without one (PDFs,
+    books indexed before offsets were recorded).
+    """
+    if meta.get("start") is None or not meta.get("source", "").startswith("http"):
+        return None
+    text = open_book_text(meta["source"])
+    if not text:
+        return None
+    batch, page = locate_offset(text, meta["start"])
+    return {"doc_id": meta.get("doc_id"), "chapter": meta.get("chapter"), "batch": batch, "page": page}
 
 
 # =========================
@@ -179,9 +568,10 @@ def main():
     )
 
     load_css()
+    recover_partial_answer()
 
     # Sidebar is always visible (nav + upload + status)
-    sidebar_ui(get_pdf_text, get_text_chunks, get_vector_store)
+    sidebar_ui(index_pdfs, active_index_key, build_library, get_cache_stats, backend_stats)
 
     # ── Route to the correct page ──
     page = st.session_state.get("page", "library")
@@ -193,7 +583,7 @@ def main():
         search_page(load_book_from_web)
 
     elif page == "upload":
-        if not os.path.exists("faiss_index"):
+        if not active_index_key():
             st.markdown(welcome_card, unsafe_allow_html=True)
         else:
             book  = st.session_state.get("active_book") or {}
@@ -212,7 +602,7 @@ def main():
                 st.rerun()
 
     elif page == "reader":
-        reader_page(ask_question)
+        reader_page(stream_answer, active_index_key, reject_cached_answer, locate_passage)
 
 
 # =========================
@@ -0,0 +1,217 @@
+# ask_pipeline.py — Async question pipeline with concurrent stages, deadlines and cancellation
+
+import asyncio
+import os
+import queue
+import threading
+import time
+
+from answer_cache import context_signature
+from context_packer import CONTEXT_TOKEN_BUDGET, pack_context
+from reranker import RERANK_CANDIDATES
+from retrieval import FETCH_K, dense_search, reciprocal_rank_fusion
+
+# Per-stage deadlines (seconds)
+CACHE_DEADLINE       = float(os.getenv("BOOKCHAT_CACHE_DEADLINE", "0.5"))
+DENSE_DEADLINE       = float(os.getenv("BOOKCHAT_DENSE_DEADLINE", "5"))
+LEXICAL_DEADLINE     = float(os.getenv("BOOKCHAT_LEXICAL_DEADLINE", "1"))
+FIRST_TOKEN_DEADLINE = float(os.getenv("BOOKCHAT_FIRST_TOKEN_DEADLINE", "30"))
+LLM_DEADLINE         = float(os.getenv("BOOKCHAT_LLM_DEADLINE", "120"))
+RERANK_DEADLINE      = float(os.getenv("BOOKCHAT_RERANK_DEADLINE", "1"))
+
+_REQUIRED = object()
+
+
+async def _stage(fn, *args, deadline: float, default=_REQUIRED):
+    """
+    Run a blocking stage in a worker thread under a deadline. Optional
+    stages (given a default) degrade to it on timeout; required ones raise.
+    """
+    try:
+        return await asyncio.wait_for(asyncio.to_thread(fn, *args), deadline)
+    except asyncio.TimeoutError:
+        if default is _REQUIRED:
+            raise
+        return default
+
+
+class Target:
+    """
+    What a question is answered from. Built by the caller — a Streamlit
+    session or a headless server request — so the pipeline never touches
+    UI state.
+    """
+
+    def __init__(self, scope_key: str, db, lexical=None, dense=None, allowed: set = None):
+        self.scope_key = scope_key
+        self.db        = db
+        self.lexical   = lexical
+        self.dense     = dense or (lambda q: dense_search(db, q, k=FETCH_K))
+        self.allowed   = allowed
+
+
+class AskPipeline:
+    """
+    cache lookup ‖ dense retrieval ‖ lexical retrieval → [rerank] →
+    semantic cache → context packing → LLM.
+    astream() yields ("token", text) events followed by one ("done", info).
+    """
+
+    def __init__(self, embeddings, answer_cache, semantic_cache, get_chain,
+                 prompt_version: str, k: int = 4, context_budget: int = CONTEXT_TOKEN_BUDGET,
+                 reranker=None):
+        self.embeddings     = embeddings
+        self.answers        = answer_cache
+        self.semantic       = semantic_cache
+        self.get_chain      = get_chain
+        self.prompt_version = prompt_version
+        self.k              = k
+        self.context_budget = context_budget     # 0 = stuff whole chunks
+        self.reranker       = reranker
+
+    async def retrieve(self, question: str, target: Target) -> list:
+        dense_task = _stage(target.dense, question, deadline=DENSE_DEADLINE)
+        if target.lexical is not None:
+            # Lexical is a booster: on timeout carry on with dense results only
+            lexical_task = _stage(target.lexical.search, question, FETCH_K, target.allowed,
+                                  deadline=LEXICAL_DEADLINE, default=[])
+        else:
+            lexical_task = asyncio.sleep(0, result=[])
+        dense, lexical = await asyncio.gather(dense_task, lexical_task)
+        # With a reranker, over-fetch and let the cross-encoder pick the k
+        fetch = RERANK_CANDIDATES if self.reranker else self.k
+        ids   = reciprocal_rank_fusion([i for i, _ in dense], [i for i, _ in lexical], k=fetch)
+        docs  = [target.db.docstore.search(i) for i in ids]
+        if self.reranker:
+            # On timeout the scoring thread runs on, holding the reranker's
+            # lock; questions meanwhile skip reranking (see Reranker)
+            docs = await _stage(self.reranker.rerank, question, docs, self.k,
+                                deadline=RERANK_DEADLINE, default=docs[:self.k])
+        return docs
+
+    async def astream(self, question: str, target: Target, use_cache: bool = True):
+        started   = time.perf_counter()
+        retrieval = asyncio.create_task(self.retrieve(question, target))
+
+        if use_cache:
+            cached = await _stage(self.answers.get, target.scope_key, question, self.prompt_version,
+                                  deadline=CACHE_DEADLINE, default=None)
+            if cached is not None:
+                retrieval.cancel()
+                yield "done", {"answer": cached, "source": "cache"}
+                return
+
+        docs    = await retrieval
+        # Already embedded by retrieval — this is a query-LRU hit
+        vector  = await asyncio.to_thread(self.embeddings.embed_query, question)
+        context = context_signature(docs)
+
+        if use_cache:
+            answer, audit_id = await _stage(
+                self.semantic.get, target.scope_key, self.prompt_version, question, vector, context,
+                deadline=CACHE_DEADLINE, default=(None, None),
+            )
+            if answer is not None:
+                yield "done", {"answer": answer, "source": "semantic", "audit_id": audit_id,
+                               "sources": [d.metadata for d in docs]}
+                return
+
+        tokens = None
+        if self.context_budget > 0:
+            docs, tokens = await asyncio.to_thread(pack_context, docs, question, self.context_budget)
+
+        chain   = self.get_chain()
+        stream  = chain.astream({"context": docs, "input": question}).__aiter__()
+        llm_at  = time.perf_counter()
+        ttft    = None
+        parts   = []
+        while True:
+            # First token and the whole answer have separate deadlines
+            limit = FIRST_TOKEN_DEADLINE if ttft is None else LLM_DEADLINE - (time.perf_counter() - llm_at)
+            try:
+                piece = await asyncio.wait_for(stream.__anext__(), max(limit, 0))
+            except StopAsyncIteration:
+                break
+            if ttft is None:
+                ttft = time.perf_counter() - llm_at
+            parts.append(piece)
+            yield "token", piece
+
+        answer = "".join(parts)
+        await asyncio.to_thread(self.answers.put, target.scope_key, question, self.prompt_version, answer)
+        await asyncio.to_thread(self.semantic.put, target.scope_key, self.prompt_version,
+                                question, vector, context, answer)
+        yield "done", {
+            "answer":         answer,
+            "source":         "llm",
+            "ttft":           ttft or 0.0,
+            "total":          time.perf_counter() - llm_at,
+            "retrieval":      llm_at - started,
+            "context_tokens": tokens,
+            "sources":        [d.metadata for d in docs],
+        }
+
+    async def answer(self, question: str, target: Target, use_cache: bool = True) -> dict:
+        """Headless form: the final ("done") info once the answer is complete."""
+        async for event, payload in self.astream(question, target, use_cache):
+            if event == "done":
+                return payload
+
+
+# =========================
+# SYNC BRIDGE
+# Streamlit scripts are synchronous; questions run on one shared event
+# loop thread, and each session's runner cancels its previous question
+# (including the in-flight LLM request) when a new one arrives.
+# =========================
+
+_loop      = None
+_loop_lock = threading.Lock()
+
+
+def _get_loop() -> asyncio.AbstractEventLoop:
+    global _loop
+    with _loop_lock:
+        if _loop is None:
+            _loop = asyncio.new_event_loop()
+            threading.Thread(target=_loop.run_forever, daemon=True).start()
+        return _loop
+
+
+class QuestionRunner:
+    def __init__(self):
+        self._current = None
+
+    def cancel(self):
+        if self._current is not None and not self._current.done():
+            self._current.cancel()
+
+    def stream(self, agen):
+        """Iterate an async generator from sync code, on the shared loop."""
+        self.cancel()
+        q = queue.Queue()
+
+        async def pump():
+            try:
+                async for item in agen:
+                    q.put(("item", item))
+                q.put(("end", None))
+            except asyncio.CancelledError:
+                q.put(("end", None))
+                raise
+            except BaseException as e:
+                q.put(("error", e))
+
+        future = self._current = asyncio.run_coroutine_threadsafe(pump(), _get_loop())
+        try:
+            while True:
+                kind, item = q.get()
+                if kind == "item":
+                    yield item
+                elif kind == "error":
+                    raise item
+                else:
+                    return
+        finally:
+            # Consumer stopped early (rerun / navigation) — stop the LLM call too
+            future.cancel()
@@ -0,0 +1,96 @@
+# ann_report.py — Recall@k and query latency of IVF / HNSW vs. the flat baseline
+#
+# Usage (from code/):
+#   python benchmarks/ann_report.py                     # bundled books, MiniLM vectors
+#   python benchmarks/ann_report.py --synthetic 200000  # clustered random vectors
+#
+# Prints a markdown table. The "auto" thresholds in ann_index.py come from
+# it (see the Readme): flat up to FLAT_MAX_VECTORS (50,000), where exact
+# search still takes under ~8 ms; HNSW up to HNSW_MAX_VECTORS (150,000);
+# IVF beyond, where nprobe 16 beats efSearch 64 on recall and latency.
+
+import argparse
+import glob
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from ann_index import build_index, tune_search  # noqa: E402
+
+
+def book_vectors() -> np.ndarray:
+    from langchain_huggingface import HuggingFaceEmbeddings
+    from langchain_text_splitters import RecursiveCharacterTextSplitter
+
+    splitter = RecursiveCharacterTextSplitter(chunk_size=5000, chunk_overlap=500)
+    chunks = []
+    for path in sorted(glob.glob("books/*.txt")):
+        with open(path, encoding="utf-8") as f:
+            chunks.extend(splitter.split_text(f.read()))
+    model = HuggingFaceEmbeddings(model_name="all-MiniLM-L6-v2")
+    return np.asarray(model.embed_documents(chunks), dtype=np.float32)
+
+
+def synthetic_vectors(n: int, d: int = 384, clusters: int = 256, seed: int = 0) -> np.ndarray:
+    rng     = np.random.default_rng(seed)
+    centres = rng.normal(size=(clusters, d)).astype(np.float32)
+    labels  = rng.integers(0, clusters, size=n)
+    return centres[labels] + 0.3 * rng.normal(size=(n, d)).astype(np.float32)
+
+
+def measure(index, queries: np.ndarray, k: int):
+    start = time.perf_counter()
+    _, ids = index.search(queries, k)
+    ms_per_query = 1000 * (time.perf_counter() - start) / len(queries)
+    return ids, ms_per_query
+
+
+def recall(found: np.ndarray, truth: np.ndarray) -> float:
+    hits = sum(len(set(f) & set(t)) for f, t in zip(found, truth))
+    return hits / truth.size
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--synthetic", type=int, default=0,
+                    help="use N clustered random vectors instead of the bundled books")
+    ap.add_argument("--queries", type=int, default=200)
+    ap.add_argument("-k", type=int, default=4)
+    args = ap.parse_args()
+
+    vectors = synthetic_vectors(args.synthetic) if args.synthetic else book_vectors()
+    rng     = np.random.default_rng(1)
+    q_idx   = rng.choice(len(vectors), size=min(args.queries, len(vectors)), replace=False)
+    # Perturb held-in vectors so queries aren't exact duplicates
+    queries = vectors[q_idx] + 0.05 * rng.normal(size=(len(q_idx), vectors.shape[1])).astype(np.float32)
+
+    flat = build_index(vectors, kind="flat")
+    truth, flat_ms = measure(flat, queries, args.k)
+
+    rows = [("flat", "-", 1.0, flat_ms)]
+    for kind, params in [("ivf", [1, 4, 16, 64]), ("hnsw", [16, 32, 64, 128])]:
+        start = time.perf_counter()
+        index = build_index(vectors, kind=kind)
+        build_s = time.perf_counter() - start
+        for p in params:
+            if kind == "ivf":
+                tune_search(index, nprobe=p)
+            else:
+                tune_search(index, ef_search=p)
+            ids, ms = measure(index, queries, args.k)
+            label = f"nprobe={p}" if kind == "ivf" else f"efSearch={p}"
+            rows.append((kind, f"{label} (build {build_s:.1f}s)", recall(ids, truth), ms))
+
+    print(f"{len(vectors):,} vectors · d={vectors.shape[1]} · {len(queries)} queries · k={args.k}\n")
+    print("| index | params | recall@k | ms/query |")
+    print("|---|---|---|---|")
+    for kind, params, r, ms in rows:
+        print(f"| {kind} | {params} | {r:.3f} | {ms:.3f} |")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+# book_store_report.py — Disk use and read latency of plain vs. compressed book storage
+#
+# Usage (from code/):
+#   python benchmarks/book_store_report.py              # each bundled book
+#   python benchmarks/book_store_report.py --repeat 5   # plus all books joined 5× (a very long text)
+#
+# Each text is saved into a scratch store once per codec (none, gzip, and
+# zstd if `zstandard` is installed). Prints the object size on disk and the
+# time to read one 40,000-character viewer section at random offsets:
+# "cold" inflates its frames from scratch, "warm" rereads the same section.
+# The first column is the old way — read and decode the whole plain file.
+
+import argparse
+import glob
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from book_renderer import CHARS_PER_BATCH  # noqa: E402
+from book_store import BookStore  # noqa: E402
+
+
+def codecs() -> list:
+    names = ["none", "gzip"]
+    try:
+        import zstandard  # noqa: F401
+        names.append("zstd")
+    except ImportError:
+        pass
+    return names
+
+
+def timed_us(fn, runs: int) -> float:
+    times = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - start)
+    return 1e6 * statistics.median(times)
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--repeat", type=int, default=0, help="also store all books joined N times")
+    ap.add_argument("--reads", type=int, default=200)
+    args = ap.parse_args()
+
+    texts = {}
+    for path in sorted(glob.glob("books/*.txt")):
+        with open(path, encoding="utf-8") as f:
+            texts[os.path.basename(path)] = f.read()
+    if args.repeat:
+        texts[f"all books ×{args.repeat}"] = "\n\n".join(texts.values()) * args.repeat
+
+    names = codecs()
+    rng   = random.Random(0)
+    print("| text | codec | KB on disk | vs plain | full decode µs | section cold µs | section warm µs |")
+    print("|---|---|---|---|---|---|---|")
+    for name, text in texts.items():
+        plain_size = None
+        offsets    = [rng.randrange(max(1, len(text) - CHARS_PER_BATCH)) for _ in range(args.reads)]
+        for codec in names:
+            store = BookStore(root=tempfile.mkdtemp(), compression=codec)
+            book  = store.open(store.put_text(text))
+            size  = os.path.getsize(book.path)
+            plain_size = plain_size or size
+
+            def full():
+                with open(book.path, "rb") as f:
+                    f.read().decode("utf-8")
+
+            def cold():
+                if hasattr(book, "_frames"):
+                    book._frames.clear()
+                at = rng.choice(offsets)
+                book[at:at + CHARS_PER_BATCH]
+
+            at = offsets[0]
+            full_us = timed_us(full, 5) if codec == "none" else None
+            cold_us = timed_us(cold, args.reads)
+            warm_us = timed_us(lambda: book[at:at + CHARS_PER_BATCH], args.reads)
+            print(f"| {name} | {codec} | {size / 1024:,.0f} | {size / plain_size:.2f}× "
+                  f"| {f'{full_us:,.0f}' if full_us else '—'} | {cold_us:,.0f} | {warm_us:,.0f} |")
+
+
+if __name__ == "__main__":
+    main()
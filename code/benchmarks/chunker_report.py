@@ -0,0 +1,70 @@
+# chunker_report.py — Structure-aware chunker vs. RecursiveCharacterTextSplitter
+#
+# Usage (from code/):
+#   python benchmarks/chunker_report.py              # each bundled book
+#   python benchmarks/chunker_report.py --repeat 10  # plus all books joined 10× (a very long novel)
+#
+# Both run with chunk_size=5000 / overlap=500. Prints time per book (best
+# of --runs), chunk counts and how many chunks start mid-paragraph.
+
+import argparse
+import glob
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from langchain_text_splitters import RecursiveCharacterTextSplitter  # noqa: E402
+
+from chunker import CHUNK_OVERLAP, CHUNK_SIZE, split_structured  # noqa: E402
+
+
+def best_of(fn, runs: int):
+    times = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        out = fn()
+        times.append(time.perf_counter() - start)
+    return out, min(times)
+
+
+def mid_paragraph(chunks: list) -> int:
+    """Chunks whose first line doesn't open a paragraph (a cut inside one)."""
+    return sum(1 for c in chunks if c[:1].islower())
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--repeat", type=int, default=0, help="also time all books joined N times")
+    ap.add_argument("--runs", type=int, default=3)
+    args = ap.parse_args()
+
+    texts = {}
+    for path in sorted(glob.glob("books/*.txt")):
+        with open(path, encoding="utf-8") as f:
+            texts[os.path.basename(path)] = f.read()
+    if args.repeat:
+        texts[f"all books ×{args.repeat}"] = "\n\n".join(texts.values()) * args.repeat
+
+    splitter = RecursiveCharacterTextSplitter(chunk_size=CHUNK_SIZE, chunk_overlap=CHUNK_OVERLAP)
+    print("| text | chars | splitter ms | chunker ms | speed-up | chunks (splitter / chunker) "
+          "| mid-paragraph starts | chapters |")
+    print("|---|---|---|---|---|---|---|---|")
+    for name, text in texts.items():
+        old, old_s = best_of(lambda: splitter.split_text(text), args.runs)
+        new, new_s = best_of(lambda: split_structured(text), args.runs)
+        chunks     = [c for c, _ in new]
+        chapters   = len({m["chapter"] for _, m in new})
+        print(f"| {name} | {len(text):,} | {1000 * old_s:.1f} | {1000 * new_s:.1f} "
+              f"| {old_s / new_s:.1f}× | {len(old)} / {len(chunks)} "
+              f"| {mid_paragraph(old)} / {mid_paragraph(chunks)} | {chapters} |")
+
+    sizes = [len(c) for c, _ in new]
+    print(f"\nchunker sizes on the last text: mean {statistics.mean(sizes):.0f}, "
+          f"max {max(sizes)} characters")
+
+
+if __name__ == "__main__":
+    main()
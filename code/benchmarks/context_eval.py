@@ -0,0 +1,131 @@
+# context_eval.py — Stuffed vs. token-budgeted context on a small QA eval set
+#
+# Usage (from code/):
+#   python benchmarks/context_eval.py                  # context tokens + recall only
+#   python benchmarks/context_eval.py --llm            # also answer with the configured backend
+#   python benchmarks/context_eval.py --budget 1000
+#   python benchmarks/context_eval.py --rerank         # cross-encoder over 30 fused candidates
+#   python benchmarks/context_eval.py --lexical-only   # BM25 retrieval, no embedding model needed
+#
+# Questions live in benchmarks/context_eval.jsonl: each names a bundled
+# book and the words a correct answer must contain. "Context recall" is
+# the share of questions whose context contains an expected word; with
+# --llm, "accuracy" is the same test on the model's answer.
+
+import argparse
+import glob
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from chunker import split_structured  # noqa: E402
+from context_packer import CONTEXT_TOKEN_BUDGET, count_tokens, pack_context  # noqa: E402
+from lexical_index import LEXICAL_FILE, LexicalIndex, LexicalIndexBuilder  # noqa: E402
+from reranker import RERANK_CANDIDATES, Reranker  # noqa: E402
+from retrieval import hybrid_search  # noqa: E402
+
+EVAL_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "context_eval.jsonl")
+
+
+def build_book(book_id: str, embeddings):
+    """(db, lexical) for one bundled book; without embeddings db only has a docstore."""
+    path = glob.glob(f"books/{book_id}_*.txt")[0]
+    with open(path, encoding="utf-8") as f:
+        # The app's chunker, so the eval packs the same chunks the app does
+        chunks = [c for c, _ in split_structured(f.read())]
+    ids = [f"c{n}" for n in range(len(chunks))]
+    if embeddings is not None:
+        from langchain_community.vectorstores import FAISS
+        db = FAISS.from_texts(chunks, embeddings, ids=ids)
+    else:
+        from langchain_community.docstore.in_memory import InMemoryDocstore
+        from langchain_core.documents import Document
+        db = SimpleNamespace(docstore=InMemoryDocstore(
+            {i: Document(page_content=c, id=i) for i, c in zip(ids, chunks)}))
+
+    builder = LexicalIndexBuilder()
+    for doc_id, text in zip(ids, chunks):
+        builder.add(doc_id, text)
+    folder = tempfile.mkdtemp()
+    builder.save(folder)
+    return db, LexicalIndex(os.path.join(folder, LEXICAL_FILE))
+
+
+def contains(text: str, words: list) -> bool:
+    text = text.lower()
+    return any(w.lower() in text for w in words)
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--budget", type=int, default=CONTEXT_TOKEN_BUDGET)
+    ap.add_argument("-k", type=int, default=4)
+    ap.add_argument("--llm", action="store_true", help="answer each question with both contexts")
+    ap.add_argument("--rerank", action="store_true", help="rerank over-fetched candidates first")
+    ap.add_argument("--lexical-only", action="store_true", help="retrieve with BM25 alone (no dense search)")
+    args = ap.parse_args()
+
+    embeddings = None
+    if not args.lexical_only:
+        from langchain_huggingface import HuggingFaceEmbeddings
+        embeddings = HuggingFaceEmbeddings(model_name="all-MiniLM-L6-v2")
+    dense = [] if args.lexical_only else None
+
+    with open(EVAL_FILE, encoding="utf-8") as f:
+        cases = [json.loads(line) for line in f if line.strip()]
+    books = {c["book"]: build_book(c["book"], embeddings) for c in cases}
+
+    reranker = None
+    if args.rerank:
+        reranker = Reranker(budget_ms=float("inf"))
+        reranker.warm_up()
+
+    chain = None
+    if args.llm:
+        import app
+        chain = app.get_chain()
+
+    results = {"stuffed": [], "packed": []}
+    for case in cases:
+        db, lexical = books[case["book"]]
+        if reranker:
+            docs = hybrid_search(db, lexical, case["question"], k=RERANK_CANDIDATES, dense=dense)
+            docs = reranker.rerank(case["question"], docs, args.k)
+        else:
+            docs = hybrid_search(db, lexical, case["question"], k=args.k, dense=dense)
+        packed, _ = pack_context(docs, case["question"], args.budget)
+        for mode, context in (("stuffed", docs), ("packed", packed)):
+            text = "\n\n".join(d.page_content for d in context)
+            row  = {"tokens": count_tokens(text), "recall": contains(text, case["expect"])}
+            if chain is not None:
+                start  = time.perf_counter()
+                answer = chain.invoke({"context": context, "input": case["question"]})
+                row["latency"] = time.perf_counter() - start
+                row["correct"] = contains(answer, case["expect"])
+            results[mode].append(row)
+
+    print(f"{len(cases)} questions · k={args.k} · budget={args.budget} tokens"
+          f"{' · BM25 only' if args.lexical_only else ''}"
+          f"{f' · reranked ({reranker.ms_per_pair:.1f} ms/pair)' if reranker else ''}\n")
+    header = "| context | mean tokens | context recall |"
+    if chain is not None:
+        header += " accuracy | mean LLM s |"
+    print(header)
+    print("|---" * (header.count("|") - 1) + "|")
+    for mode, rows in results.items():
+        line = (f"| {mode} | {statistics.mean(r['tokens'] for r in rows):.0f} "
+                f"| {sum(r['recall'] for r in rows) / len(rows):.2f} |")
+        if chain is not None:
+            line += (f" {sum(r['correct'] for r in rows) / len(rows):.2f} "
+                     f"| {statistics.mean(r['latency'] for r in rows):.2f} |")
+        print(line)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,141 @@
+# http_report.py — Pooled, cached HTTP client vs. bare requests.get, on a local stub server
+#
+# Usage (from code/):
+#   python benchmarks/http_report.py
+#   python benchmarks/http_report.py --loads 20
+#
+# Serves the bundled books from 127.0.0.1 with ETag / Last-Modified (and
+# 304 answers to conditional requests), then loads each book --loads
+# times: with bare requests.get, and through http_client — first within
+# the freshness window, then with it set to 0 so every load revalidates.
+# Prints requests the server saw, TCP connections opened, body bytes
+# sent, and wall time. Last, one book wrapped in a Gutenberg header and
+# licence footer is streamed through book_loader.stream_book — which stops
+# reading at the END marker — to check that the body is still cached.
+
+import argparse
+import glob
+import hashlib
+import os
+import sys
+import tempfile
+import threading
+import time
+from email.utils import formatdate
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import requests  # noqa: E402
+
+import book_loader  # noqa: E402
+from book_store import BookStore  # noqa: E402
+from http_client import HttpCache, HttpClient  # noqa: E402
+
+BOOKS = {os.path.basename(p): open(p, "rb").read() for p in sorted(glob.glob("books/*.txt"))}
+FOOTERED = "footered.txt"
+SERVED = dict(BOOKS)
+SERVED[FOOTERED] = (
+    b"The Project Gutenberg eBook of Stub\r\n\r\n*** START OF THE PROJECT GUTENBERG EBOOK STUB ***\r\n"
+    + next(iter(BOOKS.values()))
+    + b"\r\n*** END OF THE PROJECT GUTENBERG EBOOK STUB ***\r\n"
+    + b"Updated editions will replace the previous one.\r\n" * 400
+)
+SERVED_AT = formatdate(usegmt=True)
+
+
+class Counter:
+    def __init__(self):
+        self.requests, self.bytes, self.ports = 0, 0, set()
+
+    def reset(self):
+        self.__init__()
+
+
+COUNT = Counter()
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"     # keep-alive, so pooled connections are reused
+
+    def do_GET(self):
+        COUNT.requests += 1
+        COUNT.ports.add(self.client_address[1])
+        body = SERVED.get(self.path.lstrip("/"))
+        if body is None:
+            self.send_response(404)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        etag = '"%s"' % hashlib.sha256(body).hexdigest()[:16]
+        if self.headers.get("If-None-Match") == etag:
+            self.send_response(304)
+            self.send_header("ETag", etag)
+            self.end_headers()
+            return
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.send_header("ETag", etag)
+        self.send_header("Last-Modified", SERVED_AT)
+        self.end_headers()
+        self.wfile.write(body)
+        COUNT.bytes += len(body)
+
+    def log_message(self, *args):
+        pass
+
+
+def run(label: str, base: str, fetch, loads: int):
+    COUNT.reset()
+    start = time.perf_counter()
+    for _ in range(loads):
+        for name, body in BOOKS.items():
+            assert fetch(f"{base}/{name}") == body
+    elapsed = time.perf_counter() - start
+    print(f"| {label} | {COUNT.requests} | {len(COUNT.ports)} | {COUNT.bytes / 1e6:.1f} | {1000 * elapsed:.0f} |")
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--loads", type=int, default=10)
+    args = ap.parse_args()
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StubHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base = f"http://127.0.0.1:{server.server_address[1]}"
+
+    cache  = HttpCache(os.path.join(tempfile.mkdtemp(), "http.sqlite3"))
+    pooled = HttpClient(cache=cache)
+
+    print(f"{len(BOOKS)} books × {args.loads} loads\n")
+    print("| client | requests | connections | MB sent | ms |")
+    print("|---|---|---|---|---|")
+    run("requests.get", base, lambda u: requests.get(u, timeout=10).content, args.loads)
+    run("http_client, fresh window", base, lambda u: pooled.get(u).content, args.loads)
+    run("http_client, revalidate", base, lambda u: pooled.get(u, fresh=0).content, args.loads)
+    check_footer(base, pooled)
+    server.shutdown()
+
+
+def check_footer(base: str, client: HttpClient):
+    """stream_book stops at the footer; the body must be cached all the same."""
+    scratch = tempfile.mkdtemp()
+    book_loader.get_client        = lambda: client
+    book_loader.get_store         = lambda: BookStore(root=scratch)
+    book_loader.URL_PATTERNS_FILE = os.path.join(scratch, "url_patterns.json")
+    url = f"{base}/{FOOTERED}"
+
+    COUNT.reset()
+    first = book_loader.download_book(url)
+    assert client.is_cached(url), "footered body was not cached"
+    client.fresh = 0
+    before = client.stats()["revalidated"]
+    again  = book_loader.download_book(url)
+    assert again == first and client.stats()["revalidated"] == before + 1
+    print(f"\nstream_book with a footer: cached after one load; "
+          f"reload revalidated with {COUNT.requests - 1} request and {COUNT.bytes - len(SERVED[FOOTERED])} body bytes")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+# llm_report.py — Time to first token and tokens/sec of each LLM backend
+#
+# Usage (from code/):
+#   python benchmarks/llm_report.py                          # every backend that loads
+#   python benchmarks/llm_report.py --backends stub llamacpp
+#
+# Each backend answers the same questions over a passage from a bundled
+# book with the app's prompt. Backends whose dependency, model file or
+# server is missing are reported as skipped.
+
+import argparse
+import glob
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from langchain_core.documents import Document  # noqa: E402
+
+from llm_backends import ThroughputMeter, backend_names, get_llm  # noqa: E402
+
+QUESTIONS = [
+    "Who is the narrator?",
+    "Describe the setting of the opening chapter.",
+    "What does the main character want?",
+]
+
+
+def book_context(chars: int) -> list:
+    path = sorted(glob.glob("books/*.txt"))[0]
+    with open(path, encoding="utf-8") as f:
+        text = f.read()
+    middle = len(text) // 2
+    return [Document(page_content=text[middle:middle + chars])]
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--backends", nargs="*", default=backend_names())
+    ap.add_argument("--context-chars", type=int, default=8000)
+    args = ap.parse_args()
+
+    import app   # the same prompt the reader uses
+
+    context = book_context(args.context_chars)
+    rows    = []
+    for name in args.backends:
+        try:
+            llm = get_llm(name)
+        except Exception as e:   # missing package / model file / API key
+            rows.append((name, f"skipped: {type(e).__name__}", None))
+            continue
+        meter = ThroughputMeter(name)
+        chain = app.get_chain(llm)
+        try:
+            for q in QUESTIONS:
+                for _ in chain.stream({"context": context, "input": q}, config={"callbacks": [meter]}):
+                    pass
+        except Exception as e:   # server down, quota …
+            rows.append((name, f"failed: {type(e).__name__}", None))
+            continue
+        rows.append((name, "ok", meter.stats()))
+
+    print(f"{len(QUESTIONS)} questions · {args.context_chars:,} context chars\n")
+    print("| backend | status | TTFT ms | tokens/s |")
+    print("|---|---|---|---|")
+    for name, status, s in rows:
+        if s:
+            print(f"| {name} | {status} | {s['ttft_ms']:.0f} | {s['tokens_per_s']:.1f} |")
+        else:
+            print(f"| {name} | {status} | - | - |")
+
+
+if __name__ == "__main__":
+    main()
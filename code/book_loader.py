@@ -1,127 +1,318 @@
 # book_loader.py — Download and clean Project Gutenberg books
 
-import requests
-import re
+import codecs
+import itertools
+import json
 import os
+import re
+import tempfile
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from urllib.parse import urlparse
 
-def download_book(url: str) -> str:
-
-    headers = {
-        "User-Agent": "Mozilla/5.0"
-    }
-
-    # Try multiple Gutenberg formats
-    if "gutenberg" in url:
-
-        book_id_match = re.findall(r"\d+", url)
-
-        if book_id_match:
-
-            book_id = book_id_match[0]
-
-            possible_urls = [
-
-                f"https://www.gutenberg.org/files/{book_id}/{book_id}-0.txt",
-
-                f"https://www.gutenberg.org/files/{book_id}/{book_id}.txt",
-
-                f"https://www.gutenberg.org/cache/epub/{book_id}/pg{book_id}.txt",
-
-                url
-            ]
-
-            for u in possible_urls:
-
-                try:
+import requests
 
-                    response = requests.get(
-                        u,
-                        headers=headers,
-                        timeout=20
-                    )
+from book_store import get_store
+from embedding_cache import CACHE_DIR
+from http_client import get_client
+
+# Give up looking for a START marker after this many lines
+HEADER_SCAN_LINES = 600
+STREAM_CHUNK_BYTES = 64 * 1024
+
+_START_RE = re.compile(
+    r"\*\*\* ?START OF (THE|THIS) PROJECT GUTENBERG EBOOK .+?\*\*\*", re.IGNORECASE
+)
+_END_RE = re.compile(
+    r"\*\*\* ?END OF (THE|THIS) PROJECT GUTENBERG EBOOK .+?\*\*\*"
+    r"|End of (the )?Project Gutenberg",
+    re.IGNORECASE,
+)
+
+
+# Where Gutenberg keeps a book's plain text; which one exists varies by book
+_URL_PATTERNS = {
+    "files-0": "https://www.gutenberg.org/files/{id}/{id}-0.txt",
+    "files":   "https://www.gutenberg.org/files/{id}/{id}.txt",
+    "epub":    "https://www.gutenberg.org/cache/epub/{id}/pg{id}.txt",
+}
+# Host → the pattern that last worked for it, tried alone before racing
+URL_PATTERNS_FILE = os.path.join(CACHE_DIR, "url_patterns.json")
+PROBE_TIMEOUT     = 20
+# After the first candidate answers, how long higher-priority ones still have
+RACE_GRACE        = 0.5
+
+_probe_pool     = ThreadPoolExecutor(max_workers=8, thread_name_prefix="book-probe")
+_patterns_lock  = threading.Lock()
+_learned        = None
+
+
+def _learned_patterns() -> dict:
+    global _learned
+    with _patterns_lock:
+        if _learned is None:
+            try:
+                with open(URL_PATTERNS_FILE, "r", encoding="utf-8") as f:
+                    _learned = json.load(f)
+            except (OSError, ValueError):
+                _learned = {}
+        return _learned
+
+
+def _remember_pattern(host: str, pattern: str):
+    patterns = _learned_patterns()
+    with _patterns_lock:
+        if patterns.get(host) == pattern:
+            return
+        patterns[host] = pattern
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(prefix=".url_patterns-", dir=CACHE_DIR)
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump(patterns, f)
+        os.replace(tmp, URL_PATTERNS_FILE)
+
+
+def _candidate_urls(url: str) -> list:
+    """
+    (pattern, url) pairs that may hold this book's plain text, the given URL
+    last. A given URL that matches a pattern (the catalogue links files-0)
+    appears once, under the pattern's name.
+    """
+    book_id_match = re.findall(r"\d+", url)
+    if "gutenberg" not in url or not book_id_match:
+        return [("given", url)]
+    candidates = [(name, p.format(id=book_id_match[0])) for name, p in _URL_PATTERNS.items()]
+    if url not in (u for _, u in candidates):
+        candidates.append(("given", url))
+    return candidates
+
+
+def _fetch_text(url: str, headers: dict):
+    """The response if url answers 200 with text (not an HTML page), else None."""
+    response = get_client().get(url, headers=headers, timeout=PROBE_TIMEOUT)
+    if response.status_code == 200 and "html" not in response.headers.get("Content-Type", "").lower():
+        return response
+    response.close()
+    return None
 
-                    if response.status_code == 200:
 
-                        url = u
-                        break
+def _close_result(future):
+    if not future.cancelled() and future.exception() is None and future.result() is not None:
+        future.result().close()
 
-                except:
-                    pass
 
-    response = requests.get(
-        url,
-        headers=headers,
-        timeout=30
-    )
+def _race(candidates: list, headers: dict):
+    """
+    GET every candidate at once; return (pattern, url, response) for the
+    highest-priority candidate that answered with text, its body still
+    unread. Once any has answered, those ranked above it get RACE_GRACE
+    seconds more, so a book keeps coming from the same file (and keeps its
+    content hash) whichever server is quickest today. The other requests
+    are cancelled, or closed as soon as they return.
+    """
+    futures = [_probe_pool.submit(_fetch_text, u, headers) for _, u in candidates]
+    rank    = {future: i for i, future in enumerate(futures)}
+    pending = set(futures)
+    best    = None
+    limit   = time.monotonic() + PROBE_TIMEOUT + 5
+    while pending:
+        done, pending = wait(pending, timeout=max(0, limit - time.monotonic()),
+                             return_when=FIRST_COMPLETED)
+        if not done:
+            break
+        for future in done:
+            if future.exception() is None and future.result() is not None:
+                if best is None:
+                    limit = min(limit, time.monotonic() + RACE_GRACE)
+                if best is None or rank[future] < best:
+                    best = rank[future]
+        if best is not None and all(rank[f] > best for f in pending):
+            break
+    for i, future in enumerate(futures):
+        if i != best:
+            future.cancel()
+            future.add_done_callback(_close_result)
+    return (*candidates[best], futures[best].result()) if best is not None else None
+
+
+def _open_book_url(url: str, headers: dict):
+    """
+    Find the URL serving this book's plain text and return (response, url)
+    with the body ready to stream — the probe that found it is the
+    download. Already-cached candidates and the pattern that last worked
+    for this host are tried first; otherwise all candidates are raced.
+    """
+    candidates = _candidate_urls(url)
+    host       = urlparse(url).netloc
+    learned    = _learned_patterns().get(host)
+    client     = get_client()
+
+    first = [c for c in candidates if client.is_cached(c[1]) or c[0] == learned]
+    for name, u in first:
+        try:
+            response = _fetch_text(u, headers)
+        except requests.RequestException:
+            continue
+        if response is not None:
+            _remember_pattern(host, name)
+            return response, u
+
+    rest = [c for c in candidates if c not in first]
+    won  = _race(rest, headers) if rest else None
+    if won is None:
+        # Nothing answered with text: fetch the given URL so its error surfaces
+        return client.get(url, headers=headers, timeout=30), url
+    name, u, response = won
+    _remember_pattern(host, name)
+    return response, u
+
+
+def stream_book(url: str, chunk_bytes: int = STREAM_CHUNK_BYTES):
+    """
+    Download a Gutenberg book as a stream of cleaned text pieces.
 
+    The header is stripped, whitespace normalised and the footer cut off
+    line by line while the body is still arriving, so callers can start
+    chunking and embedding before the download finishes. The joined pieces
+    are also saved to the book store once the stream completes.
+    """
+    headers = {
+        "User-Agent": "Mozilla/5.0"
+    }
+    source = url
+    response, url = _open_book_url(url, headers)
     response.raise_for_status()
 
-    text = response.content.decode(
-        response.apparent_encoding or "utf-8",
-        errors="replace"
-    )
-    if "<html" in text.lower():
+    book_id = re.findall(r"\d+", source)[0] if re.findall(r"\d+", source) else None
 
-        raise Exception(
-            "HTML version detected. Choose another format."
-        )
+    total = 0
+    with response, get_store().writer(book_id, urls=(source, url)) as f:
+        lines = _iter_lines(response, chunk_bytes)
+        for i, line in enumerate(_clean_lines(lines)):
+            if total < 8192 and "<html" in line.lower():
+                raise Exception(
+                    "HTML version detected. Choose another format."
+                )
+            piece = line if i == 0 else "\n" + line
+            f.write(piece)
+            total += len(piece)
+            yield piece
 
-    text = _strip_gutenberg_header(text)
+        if total < 1000:
+            raise Exception("Book text too small")
 
-    text = _strip_gutenberg_footer(text)
+        # The footer was cut off unread: finish the body so the HTTP cache keeps it
+        response.finish()
+        # Save the full book text to the store for reading
+        f.commit()
 
-    text = _clean_text(text)
 
-    if len(text) < 1000:
-        raise Exception("Book text too small")
-    
-    # Save the full book text to a file for reading
-    try:
-        os.makedirs("books", exist_ok=True)
-        book_id = re.findall(r"\d+", url)[0] if re.findall(r"\d+", url) else "unknown"
-        book_title = re.sub(r'[^\w\s-]', '', url.split('/')[-1].replace('.txt', ''))[:50]
-        book_path = f"books/{book_id}_{book_title}.txt"
-        with open(book_path, "w", encoding="utf-8") as f:
-            f.write(text)
-    except Exception as e:
-        print(f"Warning: Could not save book file: {e}")
-    
-    return text
+def download_book(url: str) -> str:
+    return "".join(stream_book(url))
+
+
+def _iter_lines(response, chunk_bytes: int):
+    """Decode a streamed response incrementally and yield its lines."""
+    # requests assumes ISO-8859-1 for text/plain without a charset; Gutenberg
+    # serves those as UTF-8, so only trust an encoding the server declared
+    declared = "charset=" in response.headers.get("Content-Type", "").lower()
+    encoding = (response.encoding if declared else None) or "utf-8"
+    decoder  = codecs.getincrementaldecoder(encoding)(errors="replace")
+    buf = ""
+    for raw in response.iter_content(chunk_size=chunk_bytes):
+        buf += decoder.decode(raw)
+        if buf.endswith("\r"):
+            continue    # may be the first half of a \r\n split across chunks
+        lines = buf.replace("\r\n", "\n").replace("\r", "\n").split("\n")
+        buf = lines.pop()
+        yield from lines
+    buf += decoder.decode(b"", final=True)
+    yield from buf.replace("\r\n", "\n").replace("\r", "\n").split("\n")
+
+
+def _clean_lines(lines):
+    """
+    Strip the Gutenberg header/footer and normalise whitespace, one line at
+    a time: trailing spaces removed, runs of blank lines collapsed to one,
+    leading and trailing blank lines dropped.
+    """
+    lines = iter(lines)
+
+    # Header — buffer until the START marker, or give up and keep everything
+    head = []
+    for line in lines:
+        match = _START_RE.search(line)
+        if match:
+            head = [line[match.end():]]
+            break
+        head.append(line)
+        if len(head) > HEADER_SCAN_LINES:
+            break
+
+    started = False
+    blank   = False
+    for line in itertools.chain(head, lines):
+        end = _END_RE.search(line)
+        if end:
+            line = line[:end.start()]
+        line = line.rstrip()
+        if not line:
+            blank = started
+        else:
+            if blank:
+                yield ""
+            yield line
+            started = True
+            blank   = False
+        if end:
+            return
 
 
 def get_book_text(book_id: str, max_chars: int = None) -> str:
     """
-    Get the full book text by book ID.
+    Get the full book text by book ID (an exact match, via the store
+    manifest); None if that book hasn't been saved or can't be read.
     """
     try:
-        # Find the book file
-        books_dir = "books"
-        if not os.path.exists(books_dir):
-            return None
-            
-        for filename in os.listdir(books_dir):
-            if filename.startswith(book_id):
-                with open(os.path.join(books_dir, filename), "r", encoding="utf-8") as f:
-                    text = f.read()
-                    if max_chars:
-                        return text[:max_chars]
-                    return text
-    except Exception as e:
-        print(f"Error reading book: {e}")
-    
+        store = get_store()
+        return store.read(store.lookup(book_id=book_id), max_chars=max_chars)
+    except OSError as e:
+        return _unreadable(book_id, e)
+
+
+def _unreadable(book, error: OSError):
+    """A saved book couldn't be read: say why (unless its file is just gone) and give None."""
+    if not isinstance(error, FileNotFoundError):
+        print(f"Error reading book {book}: {error}")
     return None
 
 
 def get_book_text_by_url(url: str, max_chars: int = 5000) -> str:
-    """Get saved book text by its source URL (looks up book_id from URL)."""
+    """Get saved book text by its source URL (falls back to the book id in the URL)."""
     try:
         book_id_match = re.findall(r"\d+", url)
-        if not book_id_match:
-            return None
-        book_id = book_id_match[0]
-        return get_book_text(book_id, max_chars=max_chars)
-    except Exception:
-        return None
+        store = get_store()
+        key = store.lookup(book_id=book_id_match[0] if book_id_match else None, url=url)
+        return store.read(key, max_chars=max_chars)
+    except OSError as e:
+        return _unreadable(url, e)
+
+
+def open_book_text(url: str = None, book_id: str = None):
+    """
+    Memory-mapped view of a saved book (a book_store.BookText), by URL or
+    book id. Supports len() and slicing like the text itself, decoding only
+    the range asked for. None if the book hasn't been saved.
+    """
+    try:
+        if book_id is None and url:
+            book_id_match = re.findall(r"\d+", url)
+            book_id = book_id_match[0] if book_id_match else None
+        store = get_store()
+        return store.open(store.lookup(book_id=book_id, url=url))
+    except OSError as e:
+        return _unreadable(url or book_id, e)
 
 
 def get_book_by_url(url: str) -> tuple:
@@ -133,44 +324,6 @@ def get_book_by_url(url: str) -> tuple:
     return text, book_id
 
 
-def _strip_gutenberg_header(text: str) -> str:
-    """Remove the Gutenberg header that appears before the actual book."""
-    patterns = [
-        r"\*\*\* START OF (THE|THIS) PROJECT GUTENBERG EBOOK .+? \*\*\*",
-        r"\*\*\*START OF (THE|THIS) PROJECT GUTENBERG EBOOK .+?\*\*\*",
-    ]
-    for pattern in patterns:
-        match = re.search(pattern, text, re.IGNORECASE | re.DOTALL)
-        if match:
-            return text[match.end():]
-    return text
-
-
-def _strip_gutenberg_footer(text: str) -> str:
-    """Remove the Gutenberg footer that appears after the actual book."""
-    patterns = [
-        r"\*\*\* END OF (THE|THIS) PROJECT GUTENBERG EBOOK .+? \*\*\*",
-        r"\*\*\*END OF (THE|THIS) PROJECT GUTENBERG EBOOK .+?\*\*\*",
-        r"End of (the )?Project Gutenberg",
-    ]
-    for pattern in patterns:
-        match = re.search(pattern, text, re.IGNORECASE)
-        if match:
-            return text[:match.start()]
-    return text
-
-
-def _clean_text(text: str) -> str:
-    """Normalize whitespace and remove junk characters."""
-    # Normalize line endings
-    text = text.replace("\r\n", "\n").replace("\r", "\n")
-    # Collapse 3+ newlines into 2
-    text = re.sub(r"\n{3,}", "\n\n", text)
-    # Strip trailing whitespace per line
-    lines = [line.rstrip() for line in text.split("\n")]
-    return "\n".join(lines).strip()
-
-
 def estimate_reading_time(text: str) -> str:
     """Estimate reading time at 200 words/minute."""
     words = len(text.split())
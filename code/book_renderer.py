@@ -1,10 +1,15 @@
 # book_renderer.py — Pure PIL book page renderer (no poppler needed)
 
+import bisect
+import functools
 import re
 import textwrap
 from PIL import Image, ImageDraw, ImageFont
 from typing import List, Tuple
 
+# Shared with the chunker, so chunks and rendered pages agree on chapters
+from chunker import is_chapter_heading as _is_chapter_heading
+
 # ── Font paths (Liberation Serif = Times New Roman equivalent, always on Ubuntu) ──
 FONT_DIR = "/usr/share/fonts/truetype/liberation"
 FONT_REGULAR = f"{FONT_DIR}/LiberationSerif-Regular.ttf"
@@ -29,6 +34,9 @@ CHAPTER_SIZE = 24
 HEADER_SIZE  = 13
 LINE_H       = 30          # body line height (px)
 
+# Characters of book text rendered per viewer section
+CHARS_PER_BATCH = 40_000
+
 
 def _load_fonts():
     try:
@@ -42,24 +50,6 @@ def _load_fonts():
         return fb, fb, fb, fb
 
 
-def _is_chapter_heading(line: str) -> bool:
-    s = line.strip()
-    if not s:
-        return False
-    patterns = [
-        r"^(CHAPTER|Chapter|PART|Part|BOOK|Book|SECTION|Section)\s+[IVXLC\d]",
-        r"^(CHAPTER|PART|BOOK|SECTION)\s+[A-Z]",
-        r"^[IVX]+\.$",
-        r"^\d+\.$",
-    ]
-    for p in patterns:
-        if re.match(p, s):
-            return True
-    if s.isupper() and 2 <= len(s.split()) <= 6 and len(s) > 3:
-        return True
-    return False
-
-
 def _text_width(draw: ImageDraw.Draw, text: str, font) -> int:
     bbox = draw.textbbox((0, 0), text, font=font)
     return bbox[2] - bbox[0]
@@ -183,6 +173,17 @@ def _split_into_paragraphs(text: str) -> List[str]:
     return [p.strip() for p in re.split(r'\n{2,}', text) if p.strip()]
 
 
+def _paragraph_starts(text: str) -> List[int]:
+    """Offset of each paragraph _split_into_paragraphs returns, in the same order."""
+    starts, at = [], 0
+    # With the separators captured, paragraphs are the even-numbered parts
+    for i, part in enumerate(re.split(r'(\n{2,})', text)):
+        if i % 2 == 0 and part.strip():
+            starts.append(at + len(part) - len(part.lstrip()))
+        at += len(part)
+    return starts
+
+
 def _paginate(paragraphs: List[str], font, draw: ImageDraw.Draw,
               text_w: int, page_h: int) -> List[List[str]]:
     """
@@ -220,13 +221,53 @@ def _paginate(paragraphs: List[str], font, draw: ImageDraw.Draw,
     return pages
 
 
+def _paginate_batch(slice_txt: str) -> List[List[str]]:
+    paragraphs = _split_into_paragraphs(slice_txt)
+
+    # Load font for pagination calculation
+    try:
+        font = ImageFont.truetype(FONT_REGULAR, BODY_SIZE)
+    except Exception:
+        font = ImageFont.load_default(size=BODY_SIZE)
+
+    return _paginate(paragraphs, font,
+                     ImageDraw.Draw(Image.new("RGB",(1,1))),
+                     PAGE_W - 2 * MARGIN_X, PAGE_H)
+
+
+@functools.lru_cache(maxsize=32)
+def _page_starts(slice_txt: str) -> List[int]:
+    """Offset within the batch at which each rendered page begins."""
+    para_starts = _paragraph_starts(slice_txt)
+    starts, n   = [], 0
+    for page in _paginate_batch(slice_txt):
+        starts.append(para_starts[n])
+        n += len(page)
+    return starts
+
+
+def locate_offset(book_text: str, offset: int,
+                  chars_per_batch: int = CHARS_PER_BATCH) -> Tuple[int, int]:
+    """
+    (batch_index, page_index) the viewer shows a character offset on.
+    The batch is arithmetic; the page needs only that batch paginated.
+    book_text may be a str or anything sliceable like one (a BookText).
+    """
+    batch_index = max(0, min(offset, len(book_text) - 1)) // chars_per_batch
+    start       = batch_index * chars_per_batch
+    starts      = _page_starts(book_text[start: start + chars_per_batch])
+    page_index  = max(bisect.bisect_right(starts, offset - start) - 1, 0)
+    return batch_index, page_index
+
+
 def get_book_page_images(book_text: str, title: str, author: str,
                          batch_index: int = 0,
-                         chars_per_batch: int = 20_000,
+                         chars_per_batch: int = CHARS_PER_BATCH,
                          dpi: int = 90) -> Tuple[List[Image.Image], int]:
     """
     Slice book_text into batches, paginate the current batch, and
-    return (list_of_PIL_Images, total_batch_count).
+    return (list_of_PIL_Images, total_batch_count). Only the current
+    batch is read, so book_text can be a memory-mapped BookText.
     """
     total_chars   = len(book_text)
     total_batches = max(1, (total_chars + chars_per_batch - 1) // chars_per_batch)
@@ -235,17 +276,7 @@ def get_book_page_images(book_text: str, title: str, author: str,
     start     = batch_index * chars_per_batch
     slice_txt = book_text[start: start + chars_per_batch]
 
-    paragraphs = _split_into_paragraphs(slice_txt)
-
-    # Load font for pagination calculation
-    try:
-        font = ImageFont.truetype(FONT_REGULAR, BODY_SIZE)
-    except Exception:
-        font = ImageFont.load_default(size=BODY_SIZE)
-
-    pages_of_paragraphs = _paginate(paragraphs, font,
-                                     ImageDraw.Draw(Image.new("RGB",(1,1))),
-                                     PAGE_W - 2 * MARGIN_X, PAGE_H)
+    pages_of_paragraphs = _paginate_batch(slice_txt)
 
     images = []
     for page_num, page_paras in enumerate(pages_of_paragraphs, start=1):
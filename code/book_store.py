@@ -0,0 +1,418 @@
+# book_store.py — Content-addressed store for downloaded book texts (SQLite manifest)
+
+import glob
+import hashlib
+import mmap
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+import zlib
+from array import array
+from collections import OrderedDict
+
+BOOKS_DIR = "books"
+# Texts live at <root>/objects/<first 2 hex>/<content hash>.txt[.gz|.zst],
+# listed in <root>/manifest.sqlite3
+OBJECTS_SUBDIR = "objects"
+MANIFEST_FILE  = "manifest.sqlite3"
+
+# The byte offset of every CHAR_INDEX_STEP-th character is kept, so a range
+# read decodes at most this many characters it doesn't need on either side
+CHAR_INDEX_STEP = 4096
+# Memory-mapped books kept open per process
+OPEN_BOOKS_MAX  = 64
+
+# "none" saves plain UTF-8; "gzip" or "zstd" save independently compressed
+# frames of FRAME_CHARS characters, so a range read inflates only its frames
+BOOK_COMPRESSION = os.getenv("BOOKCHAT_BOOK_COMPRESSION", "none")
+FRAME_CHARS      = 16 * CHAR_INDEX_STEP
+# Decompressed frames kept per open book (the viewer rereads the same section)
+FRAME_CACHE_SIZE = 4
+
+
+def text_hash(text: str) -> str:
+    """Same key index_store.content_hash gives the text, so a book and its index share it."""
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()[:32]
+
+
+# =========================
+# CODECS
+# Each frame is a complete gzip member / zstd frame, so the object file
+# as a whole is still a valid .gz / .zst stream of the full text.
+# =========================
+
+_SUFFIX = {"none": ".txt", "gzip": ".txt.gz", "zstd": ".txt.zst"}
+
+
+def _codec(name: str):
+    """(compress, decompress) for one frame."""
+    if name == "gzip":
+        def compress(data: bytes) -> bytes:
+            c = zlib.compressobj(6, zlib.DEFLATED, 31)     # wbits 31: gzip container
+            return c.compress(data) + c.flush()
+        return compress, lambda frame: zlib.decompress(frame, 31)
+    if name == "zstd":
+        import zstandard    # optional: pip install zstandard
+        return zstandard.ZstdCompressor(level=3).compress, zstandard.ZstdDecompressor().decompress
+    raise ValueError(f"Unknown book compression {name!r} (expected none, gzip or zstd)")
+
+
+class BookWriter:
+    """
+    Streams a book into a private temp file, hashing as it goes. commit()
+    renames it to its content address and records it in the manifest;
+    until then no reader can see it.
+    """
+
+    def __init__(self, store, book_id: str = None, urls=()):
+        self._store  = store
+        self.book_id = book_id
+        self.urls    = [u for u in urls if u]
+        os.makedirs(store.objects_dir, exist_ok=True)
+        fd, self._tmp = tempfile.mkstemp(prefix=".part-", suffix=".txt", dir=store.objects_dir)
+        self._file    = os.fdopen(fd, "w", encoding="utf-8", newline="")
+        self._digest  = hashlib.sha256()
+        self._offsets = array("Q")
+        self.chars    = 0
+        self.bytes    = 0
+
+    def write(self, text: str):
+        data = text.encode("utf-8")
+        self._file.write(text)
+        self._digest.update(data)
+        # Character index, built as the text streams past
+        mark = len(self._offsets) * CHAR_INDEX_STEP
+        while mark < self.chars + len(text):
+            cut = mark - self.chars
+            self._offsets.append(self.bytes + (cut if len(data) == len(text) else len(text[:cut].encode("utf-8"))))
+            mark += CHAR_INDEX_STEP
+        self.chars += len(text)
+        self.bytes += len(data)
+
+    def commit(self) -> str:
+        self._file.close()
+        key = self._digest.hexdigest()[:32]
+        self._store._adopt(self._tmp, key, self.chars, self.book_id, self.urls, self._offsets)
+        return key
+
+    def discard(self):
+        self._file.close()
+        if os.path.exists(self._tmp):
+            os.remove(self._tmp)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        # commit() already moved the file; anything left over is abandoned
+        self.discard()
+
+
+class BookStore:
+    """
+    Book id / URL → content hash → text file. The manifest is a SQLite
+    table with those keys as primary keys, so a lookup is one index probe
+    however many books are saved, and WAL mode lets any number of readers
+    run while a download is being recorded. Object files are immutable
+    and only appear via rename, so a reader never sees a partial text.
+    """
+
+    def __init__(self, root: str = BOOKS_DIR, compression: str = BOOK_COMPRESSION):
+        if compression != "none":
+            _codec(compression)       # fail now, not after a download
+        self.root        = root
+        self.objects_dir = os.path.join(root, OBJECTS_SUBDIR)
+        self.compression = compression
+        os.makedirs(root, exist_ok=True)
+        self._conn = sqlite3.connect(os.path.join(root, MANIFEST_FILE), check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(
+            "CREATE TABLE IF NOT EXISTS objects ("
+            " hash TEXT PRIMARY KEY, path TEXT NOT NULL, chars INTEGER NOT NULL, saved REAL NOT NULL);"
+            "CREATE TABLE IF NOT EXISTS book_ids (book_id TEXT PRIMARY KEY, hash TEXT NOT NULL);"
+            "CREATE TABLE IF NOT EXISTS urls (url TEXT PRIMARY KEY, hash TEXT NOT NULL);"
+            "CREATE TABLE IF NOT EXISTS meta (name TEXT PRIMARY KEY, value TEXT);"
+            "CREATE TABLE IF NOT EXISTS char_index ("
+            " hash TEXT PRIMARY KEY, step INTEGER NOT NULL, offsets BLOB NOT NULL);"
+            "CREATE TABLE IF NOT EXISTS frames ("
+            " hash TEXT PRIMARY KEY, codec TEXT NOT NULL, frame_chars INTEGER NOT NULL, offsets BLOB NOT NULL);"
+        )
+        self._conn.commit()
+        self._lock = threading.Lock()
+        self._open = OrderedDict()    # hash → BookText, least recently used first
+        self._import_legacy()
+
+    # ── writes ──────────────────────────────────────────────────────────────
+
+    def writer(self, book_id: str = None, urls=()) -> BookWriter:
+        return BookWriter(self, book_id, urls)
+
+    def put_text(self, text: str, book_id: str = None, urls=()) -> str:
+        with self.writer(book_id, urls) as w:
+            w.write(text)
+            return w.commit()
+
+    def _adopt(self, tmp: str, key: str, chars: int, book_id: str, urls: list, offsets=None):
+        frames = None
+        if self.compression != "none":
+            tmp, frames = self._compress(tmp)
+        path = os.path.join(self.objects_dir, key[:2], key + _SUFFIX[self.compression])
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Same hash, same bytes: replacing a concurrent writer's file is harmless
+        os.replace(tmp, path)
+        self._record(key, path, chars, book_id, urls, offsets, frames)
+
+    def _compress(self, plain: str):
+        """Frame a plain temp file into a compressed one. Returns (path, frame offsets)."""
+        compress, _ = _codec(self.compression)
+        fd, packed  = tempfile.mkstemp(prefix=".part-", suffix=_SUFFIX[self.compression], dir=self.objects_dir)
+        offsets, at = array("Q"), 0
+        try:
+            with open(plain, "r", encoding="utf-8", newline="") as src, os.fdopen(fd, "wb") as dst:
+                while True:
+                    text = src.read(FRAME_CHARS)
+                    if not text:
+                        break
+                    frame = compress(text.encode("utf-8"))
+                    offsets.append(at)
+                    dst.write(frame)
+                    at += len(frame)
+        except BaseException:
+            os.remove(packed)
+            raise
+        os.remove(plain)
+        return packed, offsets
+
+    def _record(self, key: str, path: str, chars: int, book_id: str, urls: list,
+                offsets=None, frames=None):
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO objects (hash, path, chars, saved) VALUES (?, ?, ?, ?)",
+                (key, path, chars, time.time()),
+            )
+            if offsets is not None:
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO char_index (hash, step, offsets) VALUES (?, ?, ?)",
+                    (key, CHAR_INDEX_STEP, offsets.tobytes()),
+                )
+            if frames is not None:
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO frames (hash, codec, frame_chars, offsets) VALUES (?, ?, ?, ?)",
+                    (key, self.compression, FRAME_CHARS, frames.tobytes()),
+                )
+            else:
+                self._conn.execute("DELETE FROM frames WHERE hash = ?", (key,))
+            if book_id:
+                self._conn.execute("INSERT OR REPLACE INTO book_ids (book_id, hash) VALUES (?, ?)",
+                                   (book_id, key))
+            self._conn.executemany("INSERT OR REPLACE INTO urls (url, hash) VALUES (?, ?)",
+                                   [(u, key) for u in urls])
+            self._open.pop(key, None)
+
+    def _import_legacy(self):
+        """One-time: register <root>/<id>_<name>.txt files saved before the store existed."""
+        with self._lock:
+            done = self._conn.execute("SELECT 1 FROM meta WHERE name = 'legacy_imported'").fetchone()
+        if done:
+            return
+        for path in sorted(glob.glob(os.path.join(self.root, "*_*.txt"))):
+            book_id = os.path.basename(path).split("_", 1)[0]
+            if not book_id.isdigit():
+                continue
+            with open(path, "r", encoding="utf-8", newline="") as f:
+                text = f.read()
+            # Left in place: the files stay where scripts and benchmarks expect them
+            self._record(text_hash(text), path, len(text), book_id, [], char_offsets(text))
+        with self._lock, self._conn:
+            self._conn.execute("INSERT OR REPLACE INTO meta (name, value) VALUES ('legacy_imported', '1')")
+
+    # ── reads ───────────────────────────────────────────────────────────────
+
+    def lookup(self, book_id: str = None, url: str = None) -> str:
+        """Content hash saved for this URL (preferred) or book id, else None."""
+        with self._lock:
+            row = None
+            if url:
+                row = self._conn.execute("SELECT hash FROM urls WHERE url = ?", (url,)).fetchone()
+            if row is None and book_id:
+                row = self._conn.execute("SELECT hash FROM book_ids WHERE book_id = ?",
+                                         (book_id,)).fetchone()
+        return row[0] if row else None
+
+    def path(self, key: str) -> str:
+        """File holding this text, or None if it isn't saved (or was deleted)."""
+        if not key:
+            return None
+        with self._lock:
+            row = self._conn.execute("SELECT path FROM objects WHERE hash = ?", (key,)).fetchone()
+        return row[0] if row and os.path.exists(row[0]) else None
+
+    def read(self, key: str, max_chars: int = None) -> str:
+        book = self.open(key)
+        if book is None:
+            return None
+        return book.read(0, max_chars)
+
+    def open(self, key: str):
+        """A memory-mapped BookText for this hash, or None if it isn't saved."""
+        with self._lock:
+            book = self._open.get(key)
+            if book is not None:
+                self._open.move_to_end(key)
+                return book
+        path = self.path(key)
+        if path is None:
+            return None
+
+        with self._lock:
+            chars, step, blob, codec, frame_chars, frames = self._conn.execute(
+                "SELECT o.chars, c.step, c.offsets, f.codec, f.frame_chars, f.offsets FROM objects o"
+                " LEFT JOIN char_index c ON c.hash = o.hash"
+                " LEFT JOIN frames f ON f.hash = o.hash WHERE o.hash = ?", (key,),
+            ).fetchone()
+
+        if codec is not None:
+            book = FramedBookText(path, chars, codec, frame_chars, _array(frames))
+        else:
+            if blob is None:
+                # Saved before the index existed: build it once and keep it
+                with open(path, "r", encoding="utf-8", newline="") as f:
+                    offsets = char_offsets(f.read())
+                with self._lock, self._conn:
+                    self._conn.execute(
+                        "INSERT OR REPLACE INTO char_index (hash, step, offsets) VALUES (?, ?, ?)",
+                        (key, CHAR_INDEX_STEP, offsets.tobytes()),
+                    )
+                step, blob = CHAR_INDEX_STEP, offsets.tobytes()
+            book = BookText(path, chars, step, _array(blob))
+
+        with self._lock:
+            self._open[key] = book
+            while len(self._open) > OPEN_BOOKS_MAX:
+                self._open.popitem(last=False)
+        return book
+
+    def stats(self) -> dict:
+        with self._lock:
+            books, chars = self._conn.execute("SELECT COUNT(*), COALESCE(SUM(chars), 0) FROM objects").fetchone()
+        return {"books": books, "chars": chars}
+
+
+def _array(blob: bytes) -> array:
+    offsets = array("Q")
+    offsets.frombytes(blob)
+    return offsets
+
+
+def char_offsets(text: str, step: int = CHAR_INDEX_STEP) -> array:
+    """Byte offset of characters 0, step, 2·step, … in the UTF-8 encoding of text."""
+    offsets, at = array("Q"), 0
+    for i in range(0, len(text), step):
+        offsets.append(at)
+        at += len(text[i:i + step].encode("utf-8"))
+    return offsets
+
+
+class BookText:
+    """
+    Read-only view of a saved book, sliced by character offsets like a str
+    (len(), text[a:b]) but backed by a memory map: a slice decodes only the
+    bytes between the index marks around it, never the whole file.
+    """
+
+    def __init__(self, path: str, chars: int, step: int, offsets: array):
+        self.path     = path
+        self._chars   = chars
+        self._step    = step
+        self._offsets = offsets
+        with open(path, "rb") as f:
+            self._size = os.fstat(f.fileno()).st_size
+            self._mm   = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if self._size else b""
+
+    def __len__(self) -> int:
+        return self._chars
+
+    def __getitem__(self, item) -> str:
+        if isinstance(item, slice):
+            start, stop, stride = item.indices(self._chars)
+            text = self.read(start, stop) if stop > start else ""
+            return text if stride == 1 else text[::stride]
+        if item < 0:
+            item += self._chars
+        if not 0 <= item < self._chars:
+            raise IndexError("book text index out of range")
+        return self.read(item, item + 1)
+
+    def read(self, start: int = 0, end: int = None) -> str:
+        end   = self._chars if end is None else min(end, self._chars)
+        start = max(start, 0)
+        if start >= end:
+            return ""
+        if self._size == self._chars:     # ASCII: characters are bytes
+            return self._mm[start:end].decode("utf-8")
+        i, j = start // self._step, -(-end // self._step)
+        lo   = self._offsets[i]
+        hi   = self._offsets[j] if j < len(self._offsets) else self._size
+        return self._mm[lo:hi].decode("utf-8")[start - i * self._step:end - i * self._step]
+
+    def raw_bytes(self) -> bytes:
+        """The whole text as UTF-8 bytes, without decoding it."""
+        return bytes(self._mm)
+
+
+class FramedBookText(BookText):
+    """
+    BookText over a compressed object: frame n holds characters
+    [n·frame_chars, (n+1)·frame_chars), so a slice inflates only the
+    frames it overlaps. The last few inflated frames are kept.
+    """
+
+    def __init__(self, path: str, chars: int, codec: str, frame_chars: int, offsets: array):
+        super().__init__(path, chars, frame_chars, offsets)
+        self._decompress  = _codec(codec)[1]
+        self._frames      = OrderedDict()
+        self._frames_lock = threading.Lock()
+
+    def _frame(self, n: int) -> str:
+        # One lock for cache and codec: zstd decompressors aren't thread-safe
+        with self._frames_lock:
+            text = self._frames.get(n)
+            if text is not None:
+                self._frames.move_to_end(n)
+                return text
+            lo   = self._offsets[n]
+            hi   = self._offsets[n + 1] if n + 1 < len(self._offsets) else self._size
+            text = self._decompress(self._mm[lo:hi]).decode("utf-8")
+            self._frames[n] = text
+            while len(self._frames) > FRAME_CACHE_SIZE:
+                self._frames.popitem(last=False)
+            return text
+
+    def read(self, start: int = 0, end: int = None) -> str:
+        end   = self._chars if end is None else min(end, self._chars)
+        start = max(start, 0)
+        if start >= end:
+            return ""
+        i, j = start // self._step, (end - 1) // self._step
+        text = "".join(self._frame(n) for n in range(i, j + 1))
+        return text[start - i * self._step:end - i * self._step]
+
+    def raw_bytes(self) -> bytes:
+        bounds = list(self._offsets) + [self._size]
+        with self._frames_lock:
+            return b"".join(self._decompress(self._mm[lo:hi]) for lo, hi in zip(bounds, bounds[1:]))
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_store() -> BookStore:
+    """The process-wide store (one SQLite connection shared by all sessions)."""
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = BookStore()
+        return _store
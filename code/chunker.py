@@ -0,0 +1,157 @@
+# chunker.py — Single-pass, structure-aware chunker for books and PDFs
+
+import bisect
+import re
+
+CHUNK_SIZE    = 5000
+CHUNK_OVERLAP = 500
+
+# Chapter headings, as the page renderer draws them
+_HEADING_RE = re.compile(
+    r"(?:CHAPTER|Chapter|PART|Part|BOOK|Book|SECTION|Section)\s+[IVXLC\d]"
+    r"|(?:CHAPTER|PART|BOOK|SECTION)\s+[A-Z]"
+    r"|[IVX]+\.$"
+    r"|\d+\.$"
+)
+# A blank line, plus any blank lines and indentation after it
+_PARA_BREAK_RE = re.compile(r"\n[ \t]*\n\s*")
+_SPACE_RE = re.compile(r"\s*")
+_SENTENCE_END_RE = re.compile(r"[.!?…][\"”’')\]]*\s+")
+# Headings are short: a title line plus at most a subtitle or two
+_HEADING_MAX_LINES = 3
+# A heading only closes the current chunk once it holds this much body text,
+# so a run of headings (title page, contents) stays in one chunk
+_MIN_BODY = 200
+
+
+def is_chapter_heading(line: str) -> bool:
+    s = line.strip()
+    if not s:
+        return False
+    if _HEADING_RE.match(s):
+        return True
+    return s.isupper() and 2 <= len(s.split()) <= 6 and len(s) > 3
+
+
+def _paragraph_heading(para: str):
+    """The heading line if this paragraph opens a chapter, else None."""
+    lines = para.strip().split("\n")
+    if len(lines) > _HEADING_MAX_LINES or not is_chapter_heading(lines[0]):
+        return None
+    # The all-caps rule alone also matches imprints and title blocks
+    if len(lines) > 1 and not _HEADING_RE.match(lines[0].strip()):
+        return None
+    return " ".join(l.strip() for l in lines)
+
+
+# Paragraph openings that may be headings: a pattern above, or a line with
+# no lower-case letters (then checked with is_chapter_heading). The regex
+# starts with a literal blank line, so the engine skips ahead at memchr
+# speed and ordinary text never reaches Python.
+_CANDIDATE_RE = re.compile(
+    r"\n\n[ \t]*(?:(?:CHAPTER|PART|BOOK|SECTION)[ \t]+[A-Z\d]"
+    r"|(?:Chapter|Part|Book|Section)[ \t]+[IVXLC\d]"
+    r"|[^a-z\s][^a-z\n]*\n)"
+)
+# Text needed past a chunk's hard end before it can be cut while streaming
+_LOOKAHEAD = 1000
+
+
+def _cut(text: str, start: int, limit: int) -> int:
+    """End of the last whole paragraph in text[start:limit]; else the last sentence, word, or limit."""
+    last = None
+    for last in _PARA_BREAK_RE.finditer(text, start + 1, limit):
+        pass
+    if last is not None:
+        return last.start()
+    for last in _SENTENCE_END_RE.finditer(text, start + 1, limit):
+        pass
+    if last is not None:
+        return last.end()
+    space = text.rfind(" ", start + 1, limit)
+    return space + 1 if space > start else limit
+
+
+def iter_structured_chunks(pieces, chunk_size: int = CHUNK_SIZE, overlap: int = CHUNK_OVERLAP):
+    """
+    Chunk a stream of text pieces in one linear pass. Chunks are exact
+    slices of the concatenated text ending on paragraph boundaries (over-long
+    paragraphs are cut at sentence ends); a chapter heading always starts
+    a new chunk, and overlap — whole trailing paragraphs, up to `overlap`
+    characters — never crosses a chapter. Yields (text, metadata) with
+    "chapter" (0 before the first heading), "chapter_title", and the
+    "start"/"end" character offsets of the chunk in the full text.
+    """
+    buf, base = "", 0        # unreleased text; buf[0] is absolute offset `base`
+    heads, titles = [], []   # absolute offsets of heading paragraphs, and their text
+    hscan = 0                # absolute offset scanned for headings so far
+    pos   = 0                # absolute start of the next chunk
+
+    def find_headings(upto: int, final: bool = False):
+        """Record headings opening paragraphs in [hscan, upto); one whose paragraph is still incomplete waits."""
+        nonlocal hscan
+        candidates = [m.start() + 2 for m in _CANDIDATE_RE.finditer(buf, max(hscan - base - 2, 0), upto - base)]
+        if hscan == 0:
+            candidates.insert(0, 0)
+        for line in candidates:
+            at  = _SPACE_RE.match(buf, line).end()
+            nxt = _PARA_BREAK_RE.search(buf, at)
+            if nxt is None and not final:
+                hscan = line + base
+                return
+            title = _paragraph_heading(buf[at:nxt.start() if nxt else len(buf)])
+            if title:
+                heads.append(at + base)
+                titles.append(title)
+        hscan = upto
+
+    def chunks(final: bool):
+        nonlocal pos
+        end_of_text = base + len(buf)
+        while True:
+            rel = pos - base
+            while rel < len(buf) and buf[rel].isspace():
+                rel += 1
+            pos = rel + base
+            if pos >= end_of_text or (not final and end_of_text - pos < chunk_size + _LOOKAHEAD):
+                return
+
+            # Headings right after the start (title pages, contents) join this chunk
+            i = bisect.bisect_right(heads, pos)
+            while i < len(heads) and heads[i] - pos < _MIN_BODY:
+                i += 1
+            limit = heads[i] if i < len(heads) else end_of_text
+
+            if limit - pos <= chunk_size:
+                end, nxt = limit, limit
+            else:
+                end = _cut(buf, rel, rel + chunk_size) + base
+                # Overlap starts at the first paragraph inside the last `overlap` characters
+                brk = _PARA_BREAK_RE.search(buf, max(end - overlap - base, rel + 1), end - base)
+                nxt = brk.end() + base if brk else end
+            while end > pos and buf[end - 1 - base].isspace():
+                end -= 1
+
+            yield buf[rel:end - base], {
+                "chapter":       i,
+                "chapter_title": titles[i - 1] if i else "",
+                "start":         pos,
+                "end":           end,
+            }
+            pos = nxt
+
+    for piece in pieces:
+        buf += piece
+        # Only scan up to the last paragraph break: a heading's paragraph must be complete
+        brk = buf.rfind("\n\n")
+        if brk > hscan - base:
+            find_headings(brk + 2 + base)
+        yield from chunks(final=False)
+        if pos > base:
+            buf, base = buf[pos - base:], pos
+    find_headings(base + len(buf), final=True)
+    yield from chunks(final=True)
+
+
+def split_structured(text: str, chunk_size: int = CHUNK_SIZE, overlap: int = CHUNK_OVERLAP) -> list:
+    return list(iter_structured_chunks([text], chunk_size, overlap))
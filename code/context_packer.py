@@ -0,0 +1,164 @@
+# context_packer.py — Fit retrieved passages into a token budget before the LLM call
+
+import math
+import os
+import re
+import threading
+from collections import Counter
+
+from langchain_core.documents import Document
+
+from lexical_index import tokenize
+
+# Context tokens sent to the LLM per question
+CONTEXT_TOKEN_BUDGET = int(os.getenv("BOOKCHAT_CONTEXT_TOKENS", "2500"))
+# Tokenizer used for the budget; falls back to the embedding model's
+TOKENIZER        = os.getenv("BOOKCHAT_TOKENIZER", "gpt2")
+FALLBACK_TOKENIZER = "sentence-transformers/all-MiniLM-L6-v2"
+
+# Sentence ends (optionally followed by closing quotes/brackets) or blank lines
+_SENTENCE_RE  = re.compile(r"(?<=[.!?…])[\"”’')\]]*\s+|\n\s*\n")
+_GAP          = " … "
+# Overlap fragments are short; only those are checked by containment
+_FRAGMENT_MAX = 300
+
+# Question words that say nothing about which sentence answers it
+_STOPWORDS = frozenset("""
+    a about after all also an and any are as at be been before being but by can could did do does
+    for from had has have he her him his how i if in into is it its me my no not of on or our she
+    should so than that the their them then there these they this those to up was we were what when
+    where which who whom whose why will with would you your s t d ll m re ve
+""".split())
+# Terms in more than this share of the candidate sentences don't discriminate either
+_COMMON_SHARE = 0.5
+
+_tokenizer      = None
+_tokenizer_lock = threading.Lock()
+
+
+def _get_tokenizer():
+    global _tokenizer
+    with _tokenizer_lock:
+        if _tokenizer is None:
+            from transformers import AutoTokenizer
+            try:
+                _tokenizer = AutoTokenizer.from_pretrained(TOKENIZER)
+            except Exception:
+                # Offline or unloadable: the embedding model's tokenizer is already on disk
+                try:
+                    _tokenizer = AutoTokenizer.from_pretrained(FALLBACK_TOKENIZER)
+                except Exception:
+                    _tokenizer = _ApproxTokenizer()
+        return _tokenizer
+
+
+class _ApproxTokenizer:
+    """Last resort when no tokenizer loads: up-to-4-character word pieces and punctuation, near BPE counts for English."""
+
+    _PIECE_RE = re.compile(r"\w{1,4}|[^\w\s]")
+
+    def encode(self, text: str, add_special_tokens: bool = False) -> list:
+        return self._PIECE_RE.findall(text)
+
+
+def count_tokens(text: str) -> int:
+    return len(_get_tokenizer().encode(text, add_special_tokens=False))
+
+
+def split_sentences(text: str) -> list:
+    return [s.strip() for s in _SENTENCE_RE.split(text) if s and s.strip()]
+
+
+def _dedupe(docs) -> list:
+    """
+    (doc rank, position, sentence) with the text repeated by chunk overlap
+    removed: whole repeated sentences by key, and the partial sentences a
+    500-character overlap leaves at chunk edges by containment.
+    """
+    seen, kept_text, out = set(), [], []
+    for rank, doc in enumerate(docs):
+        for pos, sentence in enumerate(split_sentences(doc.page_content)):
+            key = " ".join(sentence.lower().split())
+            if key in seen:
+                continue
+            if len(sentence) <= _FRAGMENT_MAX and any(sentence in t for t in kept_text):
+                continue
+            seen.add(key)
+            out.append((rank, pos, sentence))
+        kept_text.append(doc.page_content)
+    return out
+
+
+def _score(sentences, question: str) -> list:
+    """
+    Query-term idf summed per sentence (idf over the candidate sentences),
+    plus half the best neighbour's score so selected sentences keep some
+    surrounding context. Stopwords and terms found in most sentences are
+    ignored, so a question whose content words appear nowhere scores 0
+    everywhere.
+    """
+    terms = set(tokenize(question)) - _STOPWORDS
+    bags  = [set(tokenize(s)) & terms for _, _, s in sentences]
+    df    = Counter(t for bag in bags for t in bag)
+    n     = len(sentences)
+    common = {t for t, c in df.items() if c > _COMMON_SHARE * n}
+    if common:
+        bags = [bag - common for bag in bags]
+    own   = [sum(math.log(1 + n / df[t]) for t in bag) for bag in bags]
+
+    scores = []
+    for i, (rank, _, _) in enumerate(sentences):
+        near = [own[j] for j in (i - 1, i + 1)
+                if 0 <= j < n and sentences[j][0] == rank]
+        scores.append(own[i] + 0.5 * max(near, default=0.0))
+    return scores
+
+
+def pack_context(docs, question: str, budget: int = CONTEXT_TOKEN_BUDGET):
+    """
+    Return (documents, tokens): the retrieved documents (best first)
+    reduced to their non-overlapping sentences most relevant to the
+    question, within `budget` tokens. Sentences keep their original order
+    inside each passage; dropped runs are marked with an ellipsis.
+    If no sentence shares a content word with the question (a thematic
+    question), the budget is filled with each passage's opening sentences
+    in turn instead, so every retrieved passage is represented rather than
+    a budget's worth of the first.
+    """
+    sentences = _dedupe(docs)
+    scores    = _score(sentences, question)
+    if any(scores):
+        # Relevant sentences first; the rest fill any remaining budget in
+        # retrieval order
+        order = sorted(range(len(sentences)),
+                       key=lambda i: (-scores[i], sentences[i][0], sentences[i][1]))
+    else:
+        # Round-robin: first kept sentence of every passage, then the second, ...
+        nth = Counter()
+        turn = []
+        for rank, _, _ in sentences:
+            turn.append(nth[rank])
+            nth[rank] += 1
+        order = sorted(range(len(sentences)), key=lambda i: (turn[i], sentences[i][0]))
+
+    chosen, used = set(), 0
+    for i in order:
+        cost = count_tokens(sentences[i][2]) + 1
+        if used + cost > budget:
+            continue
+        chosen.add(i)
+        used += cost
+
+    packed = []
+    for rank, doc in enumerate(docs):
+        kept = [(pos, s) for i, (r, pos, s) in enumerate(sentences) if r == rank and i in chosen]
+        if not kept:
+            continue
+        text, prev = "", None
+        for pos, s in kept:
+            if prev is not None:
+                text += " " if pos == prev + 1 else _GAP
+            text += s
+            prev = pos
+        packed.append(Document(page_content=text, metadata=doc.metadata, id=getattr(doc, "id", None)))
+    return packed, used
@@ -0,0 +1,142 @@
+# embedding_cache.py — Persistent chunk-embedding cache (SQLite)
+
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+CACHE_DIR  = "cache"
+CACHE_PATH = os.path.join(CACHE_DIR, "embeddings.sqlite3")
+
+# SQLite caps the number of bound parameters per statement
+_LOOKUP_BATCH = 500
+
+# Query-embedding LRU (in memory, per process)
+QUERY_CACHE_SIZE = int(os.getenv("BOOKCHAT_QUERY_CACHE_SIZE", "1024"))
+QUERY_CACHE_TTL  = float(os.getenv("BOOKCHAT_QUERY_CACHE_TTL", "3600"))
+
+
+def chunk_hash(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def normalize_query(text: str) -> str:
+    """Case- and whitespace-insensitive form of a question (MiniLM is uncased)."""
+    return " ".join(text.lower().split())
+
+
+class EmbeddingCache:
+    """(model name, chunk hash) → float32 vector, stored in one SQLite file."""
+
+    def __init__(self, path: str = CACHE_PATH):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings ("
+            " model TEXT NOT NULL, hash TEXT NOT NULL, vec BLOB NOT NULL,"
+            " PRIMARY KEY (model, hash))"
+        )
+        self._conn.commit()
+        self._lock = threading.Lock()
+
+    def get_many(self, model: str, hashes: list) -> dict:
+        found = {}
+        with self._lock:
+            for i in range(0, len(hashes), _LOOKUP_BATCH):
+                batch = hashes[i:i + _LOOKUP_BATCH]
+                marks = ",".join("?" * len(batch))
+                rows  = self._conn.execute(
+                    f"SELECT hash, vec FROM embeddings WHERE model = ? AND hash IN ({marks})",
+                    [model, *batch],
+                )
+                for h, blob in rows:
+                    found[h] = np.frombuffer(blob, dtype=np.float32)
+        return found
+
+    def put_many(self, model: str, items: list):
+        """items: list of (hash, vector)."""
+        rows = [(model, h, np.asarray(v, dtype=np.float32).tobytes()) for h, v in items]
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO embeddings (model, hash, vec) VALUES (?, ?, ?)",
+                rows,
+            )
+            self._conn.commit()
+
+
+class QueryEmbeddingLRU:
+    """normalized query → vector, bounded by entry count and age."""
+
+    def __init__(self, max_size: int = QUERY_CACHE_SIZE, ttl: float = QUERY_CACHE_TTL):
+        self.max_size = max_size
+        self.ttl      = ttl
+        self.hits     = 0
+        self.misses   = 0
+        self._entries = OrderedDict()    # key -> (stored_at, vector)
+        self._lock    = threading.Lock()
+
+    def get(self, key: str):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry and time.monotonic() - entry[0] < self.ttl:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            if entry:
+                del self._entries[key]
+            self.misses += 1
+            return None
+
+    def put(self, key: str, vector: list):
+        with self._lock:
+            self._entries[key] = (time.monotonic(), vector)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "entries": len(self._entries)}
+
+
+class CachedEmbeddings(Embeddings):
+    """
+    Wraps a LangChain embeddings model so embed_documents only runs the
+    model on chunks it has never seen; everything else comes from disk.
+    """
+
+    def __init__(self, base: Embeddings, model_name: str, cache: EmbeddingCache = None):
+        self.base       = base
+        self.model_name = model_name
+        self.cache      = cache or EmbeddingCache()
+        self.queries    = QueryEmbeddingLRU()
+
+    def embed_documents(self, texts: list) -> list:
+        hashes  = [chunk_hash(t) for t in texts]
+        vectors = self.cache.get_many(self.model_name, list(set(hashes)))
+
+        missing = {}
+        for t, h in zip(texts, hashes):
+            if h not in vectors:
+                missing.setdefault(h, t)
+        if missing:
+            new = self.base.embed_documents(list(missing.values()))
+            self.cache.put_many(self.model_name, list(zip(missing.keys(), new)))
+            for h, v in zip(missing.keys(), new):
+                vectors[h] = np.asarray(v, dtype=np.float32)
+
+        return [vectors[h].tolist() for h in hashes]
+
+    def embed_query(self, text: str) -> list:
+        key    = normalize_query(text)
+        vector = self.queries.get(key)
+        if vector is None:
+            vector = self.base.embed_query(key)
+            self.queries.put(key, vector)
+        return vector
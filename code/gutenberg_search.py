@@ -2,6 +2,11 @@
 
 import requests
 
+from http_client import get_client
+
+# Search results change slowly; reuse them for an hour
+SEARCH_FRESH_SECONDS = 3600
+
 
 def search_gutenberg(query: str, max_results: int = 6) -> list[dict]:
     """
@@ -10,7 +15,7 @@ def search_gutenberg(query: str, max_results: int = 6) -> list[dict]:
     """
     try:
         url = f"https://gutendex.com/books/?search={requests.utils.quote(query)}"
-        response = requests.get(url, timeout=10)
+        response = get_client().get(url, timeout=10, fresh=SEARCH_FRESH_SECONDS)
         response.raise_for_status()
         data = response.json()
     except Exception as e:
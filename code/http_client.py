@@ -0,0 +1,293 @@
+# http_client.py — Shared HTTP layer: pooled sessions, retries, conditional-request cache
+
+import hashlib
+import json
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+from requests.structures import CaseInsensitiveDict
+from urllib3.util.retry import Retry
+
+from embedding_cache import CACHE_DIR
+
+# Response metadata; bodies are files in an "http" folder beside it
+HTTP_CACHE_PATH = os.path.join(CACHE_DIR, "http.sqlite3")
+# A cached response younger than this is served without asking the server;
+# an older one is revalidated with If-None-Match / If-Modified-Since
+HTTP_FRESH_SECONDS = float(os.getenv("BOOKCHAT_HTTP_FRESH", str(24 * 3600)))
+HTTP_CACHE_MAX_MB  = int(os.getenv("BOOKCHAT_HTTP_CACHE_MB", "512"))
+HTTP_RETRIES       = int(os.getenv("BOOKCHAT_HTTP_RETRIES", "3"))
+HTTP_BACKOFF       = float(os.getenv("BOOKCHAT_HTTP_BACKOFF", "0.5"))
+HTTP_POOL_SIZE     = int(os.getenv("BOOKCHAT_HTTP_POOL_SIZE", "16"))
+
+USER_AGENT = "Mozilla/5.0"
+_BODY_CHUNK = 64 * 1024
+# Describe the bytes on the wire, not the decoded body that gets cached
+_WIRE_HEADERS = ("content-encoding", "content-length", "transfer-encoding")
+
+
+def make_session(retries: int = HTTP_RETRIES, backoff: float = HTTP_BACKOFF,
+                 pool_size: int = HTTP_POOL_SIZE) -> requests.Session:
+    """
+    A Session whose connection pools are kept per host, so repeated calls
+    reuse the TLS connection. Connection errors and 429/5xx answers to GET
+    and HEAD are retried with exponential backoff.
+    """
+    retry = Retry(
+        total=retries, connect=retries, read=retries, backoff_factor=backoff,
+        status_forcelist=(429, 500, 502, 503, 504), allowed_methods=("GET", "HEAD"),
+        raise_on_status=False, respect_retry_after_header=True,
+    )
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry)
+    session = requests.Session()
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    session.headers["User-Agent"] = USER_AGENT
+    return session
+
+
+class HttpResponse:
+    """
+    The parts of requests.Response callers use (status_code, headers,
+    encoding, iter_content, content, text, json, raise_for_status), served
+    either from the network or from a cached body file. A network body is
+    copied into the cache as it is read, and stored once it is complete —
+    a reader that stops early (a book cut at its footer) calls finish() to
+    drain the rest into the cache.
+    """
+
+    def __init__(self, url: str, status_code: int, headers: dict, encoding: str = None,
+                 live: requests.Response = None, body_path: str = None,
+                 sink_dir: str = None, on_complete=None,
+                 from_cache: bool = False, revalidated: bool = False):
+        self.url          = url
+        self.status_code  = status_code
+        self.headers      = CaseInsensitiveDict(headers)
+        self.encoding     = encoding
+        self.from_cache   = from_cache
+        self.revalidated  = revalidated
+        self._live        = live
+        self._body_path   = body_path
+        self._sink_dir    = sink_dir
+        self._on_complete = on_complete
+        self._content     = None
+        self._reading     = None
+
+    @property
+    def ok(self) -> bool:
+        return self.status_code < 400
+
+    def raise_for_status(self):
+        if self._live is not None:
+            self._live.raise_for_status()
+
+    def iter_content(self, chunk_size: int = _BODY_CHUNK):
+        chunks = self._iter_content(chunk_size)
+        if self._live is not None and self._content is None:
+            self._reading = chunks
+        return chunks
+
+    def _iter_content(self, chunk_size: int):
+        if self._content is not None:
+            for i in range(0, len(self._content), chunk_size):
+                yield self._content[i:i + chunk_size]
+            return
+        if self._live is None:
+            with open(self._body_path, "rb") as f:
+                while True:
+                    chunk = f.read(chunk_size)
+                    if not chunk:
+                        return
+                    yield chunk
+
+        sink = None
+        if self._on_complete is not None:
+            fd, tmp = tempfile.mkstemp(prefix=".part-", dir=self._sink_dir)
+            sink    = os.fdopen(fd, "wb")
+        try:
+            for chunk in self._live.iter_content(chunk_size=chunk_size):
+                if sink is not None:
+                    sink.write(chunk)
+                yield chunk
+            if sink is not None:
+                sink.close()
+                self._on_complete(tmp)
+                sink = None
+        finally:
+            # Abandoned part-way: nothing is cached
+            if sink is not None:
+                sink.close()
+                os.remove(tmp)
+
+    @property
+    def content(self) -> bytes:
+        if self._content is None:
+            self._content = b"".join(self.iter_content())
+        return self._content
+
+    @property
+    def text(self) -> str:
+        return self.content.decode(self.encoding or "utf-8", errors="replace")
+
+    def json(self):
+        return json.loads(self.content)
+
+    def finish(self):
+        """Read what the caller left of a live body, so it is cached complete."""
+        if self._reading is not None:
+            for _ in self._reading:
+                pass
+            self._reading = None
+
+    def close(self):
+        if self._live is not None:
+            self._live.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class HttpCache:
+    """
+    URL → (validators, headers, body file), kept in one SQLite table with
+    bodies as files beside it. Past `max_bytes`, the entries checked
+    longest ago are evicted.
+    """
+
+    def __init__(self, path: str = HTTP_CACHE_PATH, max_bytes: int = HTTP_CACHE_MAX_MB * 1024 * 1024):
+        self.body_dir  = os.path.join(os.path.dirname(path) or ".", "http")
+        os.makedirs(self.body_dir, exist_ok=True)
+        self.max_bytes = max_bytes
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            " url TEXT PRIMARY KEY, etag TEXT, last_modified TEXT, headers TEXT NOT NULL,"
+            " encoding TEXT, body TEXT NOT NULL, size INTEGER NOT NULL, checked REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS responses_checked ON responses (checked)")
+        self._conn.commit()
+        self._lock = threading.Lock()
+
+    def get(self, url: str):
+        """The cached entry as a dict, or None (also if its body file is gone)."""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT etag, last_modified, headers, encoding, body, checked FROM responses WHERE url = ?",
+                (url,),
+            ).fetchone()
+        if row is None or not os.path.exists(row[4]):
+            return None
+        etag, last_modified, headers, encoding, body, checked = row
+        return {"etag": etag, "last_modified": last_modified, "headers": json.loads(headers),
+                "encoding": encoding, "body": body, "checked": checked}
+
+    def put(self, url: str, response: requests.Response, tmp_body: str):
+        body    = os.path.join(self.body_dir, hashlib.sha256(url.encode("utf-8")).hexdigest())
+        headers = {k: v for k, v in response.headers.items() if k.lower() not in _WIRE_HEADERS}
+        os.replace(tmp_body, body)
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (url, response.headers.get("ETag"), response.headers.get("Last-Modified"),
+                 json.dumps(headers), response.encoding, body, os.path.getsize(body), time.time()),
+            )
+            self._evict()
+            self._conn.commit()
+
+    def touch(self, url: str):
+        """The server confirmed the entry (304): it is fresh again."""
+        with self._lock:
+            self._conn.execute("UPDATE responses SET checked = ? WHERE url = ?", (time.time(), url))
+            self._conn.commit()
+
+    def _evict(self):
+        (total,) = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()
+        for url, body, size in self._conn.execute(
+            "SELECT url, body, size FROM responses ORDER BY checked"
+        ).fetchall():
+            if total <= self.max_bytes:
+                return
+            self._conn.execute("DELETE FROM responses WHERE url = ?", (url,))
+            if os.path.exists(body):
+                os.remove(body)
+            total -= size
+
+
+class HttpClient:
+    """
+    GETs through a pooled session and the response cache. Within `fresh`
+    seconds of the last check a cached response is returned with no
+    network traffic; after that the request carries the cached ETag /
+    Last-Modified, and a 304 reuses the cached body.
+    """
+
+    def __init__(self, session: requests.Session = None, cache: HttpCache = None,
+                 fresh: float = HTTP_FRESH_SECONDS):
+        self.session     = session or make_session()
+        self.cache       = cache
+        self.fresh       = fresh
+        self.requests    = 0
+        self.hits        = 0
+        self.revalidated = 0
+
+    def get(self, url: str, headers: dict = None, timeout: float = 30,
+            fresh: float = None, cache: bool = True) -> HttpResponse:
+        fresh = self.fresh if fresh is None else fresh
+        entry = self.cache.get(url) if cache and self.cache else None
+        if entry and time.time() - entry["checked"] < fresh:
+            self.hits += 1
+            return self._cached(url, entry)
+
+        headers = dict(headers or {})
+        if entry and entry["etag"]:
+            headers["If-None-Match"] = entry["etag"]
+        if entry and entry["last_modified"]:
+            headers["If-Modified-Since"] = entry["last_modified"]
+
+        self.requests += 1
+        response = self.session.get(url, headers=headers, timeout=timeout, stream=True)
+        if response.status_code == 304 and entry:
+            response.content        # no body: reading it hands the connection back to the pool
+            self.cache.touch(url)
+            self.revalidated += 1
+            return self._cached(url, entry, revalidated=True)
+
+        storable = (cache and self.cache is not None and response.status_code == 200
+                    and "no-store" not in response.headers.get("Cache-Control", ""))
+        return HttpResponse(
+            response.url, response.status_code, response.headers, response.encoding, live=response,
+            sink_dir=self.cache.body_dir if storable else None,
+            on_complete=(lambda tmp: self.cache.put(url, response, tmp)) if storable else None,
+        )
+
+    def is_cached(self, url: str) -> bool:
+        return self.cache is not None and self.cache.get(url) is not None
+
+    def _cached(self, url: str, entry: dict, revalidated: bool = False) -> HttpResponse:
+        return HttpResponse(url, 200, entry["headers"], entry["encoding"], body_path=entry["body"],
+                            from_cache=True, revalidated=revalidated)
+
+    def stats(self) -> dict:
+        return {"requests": self.requests, "hits": self.hits, "revalidated": self.revalidated}
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_client() -> HttpClient:
+    """The process-wide client: one pooled session and cache for every caller."""
+    global _client
+    with _client_lock:
+        if _client is None:
+            _client = HttpClient(cache=HttpCache())
+        return _client
@@ -0,0 +1,284 @@
+# index_store.py — Per-document FAISS indexes keyed by content hash
+
+import hashlib
+import json
+import os
+import pickle
+import shutil
+import tempfile
+import threading
+from collections import OrderedDict
+
+from langchain_community.vectorstores import FAISS
+
+from ann_index import INDEX_TYPE, all_vectors, build_index, choose_index_type, index_kind, tune_search
+from mapped_docstore import MappedDocstore, has_mapped_chunks, save_chunks
+
+# Every document gets its own folder: indexes/<content hash>/index.faiss|.pkl
+INDEX_ROOT   = "indexes"
+SOURCES_FILE = os.path.join(INDEX_ROOT, "sources.json")
+INDEX_FILES  = ("index.faiss", "index.pkl")
+# doc id → docstore ids of its chunks, for indexes built from several documents
+DOCUMENTS_FILE = "documents.json"
+
+# Budget for loaded indexes kept in memory across all sessions
+CACHE_MAX_BYTES = int(os.getenv("BOOKCHAT_INDEX_CACHE_MB", "512")) * 1024 * 1024
+
+
+def content_hash(data) -> str:
+    """Stable key for a document: sha256 of its text or raw bytes."""
+    if isinstance(data, str):
+        data = data.encode("utf-8")
+    return hashlib.sha256(data).hexdigest()[:32]
+
+
+def index_path(key: str) -> str:
+    return os.path.join(INDEX_ROOT, key)
+
+
+def has_index(key: str) -> bool:
+    if not key:
+        return False
+    return os.path.exists(os.path.join(index_path(key), "index.faiss"))
+
+
+def save_index(db: FAISS, key: str, documents: dict = None,
+               index_type: str = INDEX_TYPE, lexical=None) -> str:
+    """
+    Save a vector store under its key.
+    Stores are built flat while streaming; if index_type (default "auto")
+    calls for IVF or HNSW at this size, the index is rebuilt as that type
+    from the stored vectors before saving.
+    lexical (a LexicalIndexBuilder) is saved alongside as lexical.npz.
+    Writes into a temp folder first and renames it into place, so two
+    sessions building the same document never see a half-written index.
+    """
+    os.makedirs(INDEX_ROOT, exist_ok=True)
+    target = index_path(key)
+    if has_index(key):
+        return target
+
+    if index_type == "auto":
+        index_type = choose_index_type(db.index.ntotal)
+    if index_kind(db.index) == "flat" and index_type != "flat":
+        db.index = build_index(all_vectors(db.index), kind=index_type)
+
+    tmp = tempfile.mkdtemp(prefix=f".{key}-", dir=INDEX_ROOT)
+    try:
+        db.save_local(tmp)
+        save_chunks(db, tmp)
+        if documents is not None:
+            with open(os.path.join(tmp, DOCUMENTS_FILE), "w", encoding="utf-8") as f:
+                json.dump(documents, f)
+        if lexical is not None:
+            lexical.save(tmp)
+        os.rename(tmp, target)
+    except OSError:
+        # Another session won the race — its index is identical, keep it
+        shutil.rmtree(tmp, ignore_errors=True)
+        if not has_index(key):
+            raise
+    return target
+
+
+def _read_faiss(path: str, mmap: bool):
+    """
+    Read index.faiss, memory-mapped when the index type allows it, so the
+    vectors live in the shared page cache instead of each process's heap.
+    """
+    import faiss
+
+    if mmap:
+        # IO_FLAG_MMAP_IFC (faiss >= 1.8) also maps flat vector codes;
+        # plain IO_FLAG_MMAP only covers IVF inverted lists
+        flags = getattr(faiss, "IO_FLAG_MMAP_IFC", faiss.IO_FLAG_MMAP) | faiss.IO_FLAG_READ_ONLY
+        try:
+            return tune_search(faiss.read_index(path, flags))
+        except RuntimeError:
+            pass
+    return tune_search(faiss.read_index(path))
+
+
+def load_index(key: str, embeddings, mmap: bool = False) -> FAISS:
+    """
+    Load a saved index. mmap=True opens the vectors and the chunk text
+    read-only and memory-mapped (near O(1) open; documents are decoded as
+    searches return them); use mmap=False for a copy to modify.
+    """
+    folder = index_path(key)
+    index  = _read_faiss(os.path.join(folder, "index.faiss"), mmap)
+    if mmap and has_mapped_chunks(folder):
+        docstore = MappedDocstore(folder)
+        return FAISS(embeddings, index, docstore, docstore.index_to_docstore_id())
+    # Writable copies, and indexes saved before the chunk files existed
+    with open(os.path.join(folder, "index.pkl"), "rb") as f:
+        docstore, index_to_docstore_id = pickle.load(f)
+    return FAISS(embeddings, index, docstore, index_to_docstore_id)
+
+
+def read_documents(key: str) -> dict:
+    try:
+        with open(os.path.join(index_path(key), DOCUMENTS_FILE), "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+# =========================
+# INCREMENTAL UPDATES
+# Documents are appended with db.add_embeddings and removed by their
+# docstore ids; nothing already embedded is recomputed. A flat index's
+# remove_ids deletes the vectors outright and shifts the rest down, so no
+# tombstones build up; IVF and HNSW are rebuilt by compact() instead.
+# =========================
+
+def remove_documents(db: FAISS, documents: dict, doc_ids: list):
+    """Drop every chunk of the given documents from db (and from documents)."""
+    ids = [i for d in doc_ids for i in documents.pop(d, [])]
+    if not ids:
+        return
+    if index_kind(db.index) != "flat":
+        # HNSW can't remove vectors, and IVF's remove_ids keeps the old ids
+        # while db.delete renumbers index_to_docstore_id — rebuild instead
+        compact(db, set(ids))
+        return
+    db.delete(ids)
+
+
+def compact(db: FAISS, drop_ids: set):
+    """
+    Rebuild db's vector index without the given docstore ids.
+    Reuses the stored vectors, so no chunk is re-embedded.
+    """
+    old     = db.index
+    vectors = all_vectors(old)
+    keep    = [pos for pos in range(old.ntotal)
+               if db.index_to_docstore_id[pos] not in drop_ids]
+
+    index = build_index(vectors[keep])
+    db.index_to_docstore_id = {
+        new: db.index_to_docstore_id[pos] for new, pos in enumerate(keep)
+    }
+    db.docstore.delete(list(drop_ids))
+    db.index = index
+
+
+def delete_index(key: str):
+    _cache.invalidate(key)
+    shutil.rmtree(index_path(key), ignore_errors=True)
+
+
+# =========================
+# LOADED INDEX CACHE
+# One process-wide LRU shared by every Streamlit session, so a question
+# costs a query embedding + search instead of unpickling from disk.
+# =========================
+
+def _index_signature(key: str):
+    """(mtime, size) of the index files — changes whenever the index is rewritten."""
+    sig = []
+    for name in INDEX_FILES:
+        st = os.stat(os.path.join(index_path(key), name))
+        sig.append((st.st_mtime_ns, st.st_size))
+    return tuple(sig)
+
+
+class VectorStoreCache:
+    """LRU of loaded vector stores, evicted by total resident bytes."""
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.hits      = 0
+        self.misses    = 0
+        self._entries  = OrderedDict()   # key -> (signature, nbytes, db)
+        self._bytes    = 0
+        self._lock     = threading.Lock()
+
+    def get(self, key: str, embeddings) -> FAISS:
+        sig = _index_signature(key)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry and entry[0] == sig:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[2]
+            self.misses += 1
+
+        # Load outside the lock so other sessions keep being served.
+        # Cached stores are read-only, so they can share mapped pages.
+        db     = load_index(key, embeddings, mmap=True)
+        nbytes = sum(size for _, size in sig)
+
+        with self._lock:
+            self._drop(key)
+            self._entries[key] = (sig, nbytes, db)
+            self._bytes += nbytes
+            # Always keep the newest entry, even if it alone exceeds the budget
+            while self._bytes > self.max_bytes and len(self._entries) > 1:
+                self._drop(next(iter(self._entries)))
+        return db
+
+    def invalidate(self, key: str):
+        with self._lock:
+            self._drop(key)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "hits":    self.hits,
+                "misses":  self.misses,
+                "entries": len(self._entries),
+                "bytes":   self._bytes,
+            }
+
+    def _drop(self, key: str):
+        entry = self._entries.pop(key, None)
+        if entry:
+            self._bytes -= entry[1]
+
+
+_cache = VectorStoreCache(CACHE_MAX_BYTES)
+
+
+def get_index(key: str, embeddings) -> FAISS:
+    """Cached load_index — reloads only if the files on disk have changed."""
+    return _cache.get(key, embeddings)
+
+
+def cache_stats() -> dict:
+    return _cache.stats()
+
+
+# =========================
+# SOURCE → KEY MAP
+# Lets a known URL skip the download entirely and go straight to its index.
+# =========================
+
+_sources_lock = threading.Lock()
+
+
+def _read_sources() -> dict:
+    try:
+        with open(SOURCES_FILE, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def lookup_source(source: str):
+    """Return the index key previously built for this URL, if it still exists."""
+    key = _read_sources().get(source)
+    return key if has_index(key) else None
+
+
+def remember_source(source: str, key: str):
+    # Read-modify-replace: without the lock, two sessions finishing at once
+    # would each drop the other's entry
+    with _sources_lock:
+        os.makedirs(INDEX_ROOT, exist_ok=True)
+        sources = _read_sources()
+        sources[source] = key
+        fd, tmp = tempfile.mkstemp(prefix=".sources-", dir=INDEX_ROOT)
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump(sources, f)
+        os.replace(tmp, SOURCES_FILE)
@@ -0,0 +1,97 @@
+# ingest.py — Batched, multi-process embedding for large ingests
+
+import multiprocessing as mp
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+# Tunables — workers=1 keeps everything in the Streamlit process
+EMBED_WORKERS    = int(os.getenv("BOOKCHAT_EMBED_WORKERS", str(max(1, (os.cpu_count() or 2) // 2))))
+EMBED_BATCH_SIZE = int(os.getenv("BOOKCHAT_EMBED_BATCH", "64"))
+
+
+# =========================
+# WORKER PROCESS
+# Each worker loads its own model copy once and pins its thread count,
+# so N workers don't fight over the same cores.
+# =========================
+
+_worker_model = None
+
+
+def _init_worker(model_name: str, threads: int):
+    global _worker_model
+    for var in ("OMP_NUM_THREADS", "MKL_NUM_THREADS", "TOKENIZERS_PARALLELISM"):
+        os.environ[var] = "false" if var == "TOKENIZERS_PARALLELISM" else str(threads)
+    import torch
+    torch.set_num_threads(threads)
+    from langchain_huggingface import HuggingFaceEmbeddings
+    _worker_model = HuggingFaceEmbeddings(model_name=model_name)
+
+
+def _embed_batch(texts: list) -> np.ndarray:
+    return np.asarray(_worker_model.embed_documents(texts), dtype=np.float32)
+
+
+# =========================
+# POOL
+# =========================
+
+_pool      = None
+_pool_lock = threading.Lock()
+
+
+def _get_pool(model_name: str, workers: int) -> ProcessPoolExecutor:
+    """One long-lived pool per process, so models load once, not per ingest."""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            threads = max(1, (os.cpu_count() or workers) // workers)
+            _pool = ProcessPoolExecutor(
+                max_workers=workers,
+                mp_context=mp.get_context("spawn"),   # torch is not fork-safe
+                initializer=_init_worker,
+                initargs=(model_name, threads),
+            )
+        return _pool
+
+
+def embed_batched(texts: list, model_name: str,
+                  workers: int = EMBED_WORKERS,
+                  batch_size: int = EMBED_BATCH_SIZE) -> np.ndarray:
+    """
+    Split texts into batches, embed them across the worker pool, and
+    return an (n, dim) float32 array in the same order as the input.
+    """
+    batches = [texts[i:i + batch_size] for i in range(0, len(texts), batch_size)]
+    pool    = _get_pool(model_name, workers)
+    # map() yields results in submission order, whatever order workers finish in
+    return np.vstack(list(pool.map(_embed_batch, batches)))
+
+
+class PooledEmbeddings(Embeddings):
+    """
+    Embeddings that fan large embed_documents calls out to the worker pool.
+    Small calls and queries stay on the in-process model — spinning up
+    workers would cost more than it saves.
+    """
+
+    def __init__(self, local: Embeddings, model_name: str,
+                 workers: int = EMBED_WORKERS, batch_size: int = EMBED_BATCH_SIZE):
+        self.local      = local
+        self.model_name = model_name
+        self.workers    = workers
+        self.batch_size = batch_size
+
+    def embed_documents(self, texts: list) -> list:
+        if self.workers <= 1 or len(texts) < 2 * self.batch_size:
+            return self.local.embed_documents(texts)
+        return embed_batched(texts, self.model_name,
+                             workers=self.workers,
+                             batch_size=self.batch_size).tolist()
+
+    def embed_query(self, text: str) -> list:
+        return self.local.embed_query(text)
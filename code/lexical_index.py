@@ -0,0 +1,168 @@
+# lexical_index.py — Compact, array-backed BM25 inverted index
+
+import os
+import re
+import threading
+from collections import Counter, OrderedDict
+
+import numpy as np
+
+LEXICAL_FILE = "lexical.npz"
+
+BM25_K1 = 1.2
+BM25_B  = 0.75
+
+_TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+
+
+def tokenize(text: str) -> list:
+    return _TOKEN_RE.findall(text.lower())
+
+
+class LexicalIndexBuilder:
+    """Collects term frequencies chunk by chunk while the index is being built."""
+
+    def __init__(self):
+        self.ids      = []       # docstore id of each chunk, in add order
+        self.lengths  = []
+        self.postings = {}       # term -> ([chunk numbers], [tfs])
+
+    def add(self, doc_id: str, text: str):
+        n      = len(self.ids)
+        counts = Counter(tokenize(text))
+        self.ids.append(doc_id)
+        self.lengths.append(sum(counts.values()))
+        for term, tf in counts.items():
+            docs, tfs = self.postings.setdefault(term, ([], []))
+            docs.append(n)
+            tfs.append(tf)
+
+    @classmethod
+    def from_saved(cls, folder: str, skip: set = frozenset()):
+        """
+        A builder holding the chunks of a saved lexical index (minus skip),
+        so an incremental update tokenizes only its new chunks. None if the
+        folder has no lexical index.
+        """
+        path = os.path.join(folder, LEXICAL_FILE)
+        if not os.path.exists(path):
+            return None
+        builder = cls()
+        with np.load(path, allow_pickle=False) as data:
+            ids     = data["ids"].tolist()
+            keep    = np.array([i not in skip for i in ids], dtype=bool)
+            new_pos = np.cumsum(keep) - 1          # chunk number once skipped ones are gone
+            builder.ids     = [i for i, k in zip(ids, keep) if k]
+            builder.lengths = data["lengths"][keep].tolist()
+
+            offsets, doc_ids, tfs = data["offsets"], data["doc_ids"], data["tfs"]
+            kept = keep[doc_ids]
+            for t, term in enumerate(data["terms"].tolist()):
+                lo, hi = offsets[t], offsets[t + 1]
+                mask   = kept[lo:hi]
+                if mask.any():
+                    builder.postings[term] = (new_pos[doc_ids[lo:hi][mask]].tolist(),
+                                              tfs[lo:hi][mask].tolist())
+        return builder
+
+    def add_from_store(self, db, skip: set = frozenset()):
+        """Seed with the chunks already in a vector store (incremental updates)."""
+        for doc_id in db.index_to_docstore_id.values():
+            if doc_id not in skip:
+                self.add(doc_id, db.docstore.search(doc_id).page_content)
+
+    def save(self, folder: str):
+        """
+        Write CSR-style arrays: postings of term i are
+        doc_ids[offsets[i]:offsets[i+1]] with matching tfs.
+        """
+        terms   = sorted(self.postings)
+        sizes   = [len(self.postings[t][0]) for t in terms]
+        offsets = np.zeros(len(terms) + 1, dtype=np.int64)
+        np.cumsum(sizes, out=offsets[1:])
+        doc_ids = np.fromiter((d for t in terms for d in self.postings[t][0]),
+                              dtype=np.int32, count=int(offsets[-1]))
+        tfs     = np.fromiter((f for t in terms for f in self.postings[t][1]),
+                              dtype=np.uint16, count=int(offsets[-1]))
+        np.savez(
+            os.path.join(folder, LEXICAL_FILE),
+            terms=np.array(terms, dtype=str),
+            offsets=offsets,
+            doc_ids=doc_ids,
+            tfs=tfs,
+            lengths=np.asarray(self.lengths, dtype=np.int32),
+            ids=np.array(self.ids, dtype=str),
+        )
+
+
+class LexicalIndex:
+    """BM25 search over the saved arrays. One vectorised pass per query term."""
+
+    def __init__(self, path: str):
+        with np.load(path, allow_pickle=False) as data:
+            self.term_id = {t: i for i, t in enumerate(data["terms"].tolist())}
+            self.offsets = data["offsets"]
+            self.doc_ids = data["doc_ids"]
+            self.tfs     = data["tfs"].astype(np.float32)
+            self.lengths = data["lengths"].astype(np.float32)
+            self.ids     = data["ids"].tolist()
+        self.n_docs  = len(self.ids)
+        self.avg_len = float(self.lengths.mean()) if self.n_docs else 0.0
+        self.pos_of  = {doc_id: n for n, doc_id in enumerate(self.ids)}
+        # Per-document length normalisation, fixed for the life of the index
+        self.norm    = BM25_K1 * (1 - BM25_B + BM25_B * self.lengths / max(self.avg_len, 1e-6))
+
+    def search(self, query: str, k: int = 20, allowed: set = None) -> list:
+        """[(docstore id, bm25 score)] best first; allowed restricts to those ids."""
+        if not self.n_docs:
+            return []
+        scores = np.zeros(self.n_docs, dtype=np.float32)
+        for term in set(tokenize(query)):
+            t = self.term_id.get(term)
+            if t is None:
+                continue
+            lo, hi = self.offsets[t], self.offsets[t + 1]
+            docs   = self.doc_ids[lo:hi]
+            tf     = self.tfs[lo:hi]
+            idf    = np.log(1 + (self.n_docs - len(docs) + 0.5) / (len(docs) + 0.5))
+            scores[docs] += idf * tf * (BM25_K1 + 1) / (tf + self.norm[docs])
+
+        if allowed is not None:
+            mask = np.zeros(self.n_docs, dtype=bool)
+            mask[[self.pos_of[i] for i in allowed if i in self.pos_of]] = True
+            scores[~mask] = 0
+
+        hits = np.flatnonzero(scores)
+        if len(hits) > k:
+            hits = hits[np.argpartition(-scores[hits], k)[:k]]
+        hits = hits[np.argsort(-scores[hits])]
+        return [(self.ids[n], float(scores[n])) for n in hits]
+
+
+# =========================
+# LOADED LEXICAL INDEXES
+# =========================
+
+_MAX_LOADED = 8
+_loaded      = OrderedDict()     # path -> (mtime, LexicalIndex)
+_loaded_lock = threading.Lock()
+
+
+def get_lexical(folder: str):
+    """The lexical index saved in an index folder, or None for older indexes."""
+    path = os.path.join(folder, LEXICAL_FILE)
+    try:
+        mtime = os.stat(path).st_mtime_ns
+    except OSError:
+        return None
+    with _loaded_lock:
+        entry = _loaded.get(path)
+        if entry and entry[0] == mtime:
+            _loaded.move_to_end(path)
+            return entry[1]
+    lex = LexicalIndex(path)
+    with _loaded_lock:
+        _loaded[path] = (mtime, lex)
+        while len(_loaded) > _MAX_LOADED:
+            _loaded.popitem(last=False)
+    return lex
@@ -0,0 +1,146 @@
+# library_index.py — One index over the whole catalogue, with filtered search
+
+import re
+import threading
+
+import numpy as np
+
+from ann_index import HNSW_EF_SEARCH, IVF_NPROBE, index_kind
+from index_store import get_index, lookup_source, read_documents
+
+# The library is saved like any other index; this source name points at
+# its current content key (it changes as books are added).
+LIBRARY_SOURCE = "library://catalogue"
+
+# Filters matching at most this many chunks are searched exactly over just
+# those vectors; larger ones use a FAISS ID selector inside the main index.
+EXACT_SUBSET_MAX = 20_000
+
+
+def book_id_from_url(url: str) -> str:
+    ids = re.findall(r"\d+", url or "")
+    return ids[0] if ids else None
+
+
+def chunk_metadata(book: dict, position: int) -> dict:
+    return {
+        "book_id":  book_id_from_url(book["url"]),
+        "title":    book["title"],
+        "author":   book.get("author", ""),
+        "genre":    book.get("genre", ""),
+        "position": position,
+        "source":   book["url"],
+    }
+
+
+def library_key():
+    return lookup_source(LIBRARY_SOURCE)
+
+
+class LibraryIndex:
+    """
+    Filter-aware search over the library store.
+
+    Per-book, per-author and per-genre postings (sorted arrays of index
+    positions) are built once per loaded index from documents.json and one
+    metadata lookup per book, never per chunk.
+    """
+
+    def __init__(self, key: str, db):
+        self.key = key
+        self.db  = db
+        pos_of   = {doc_id: pos for pos, doc_id in db.index_to_docstore_id.items()}
+
+        fields = {"book_id": {}, "author": {}, "genre": {}}
+        for book_id, ids in read_documents(key).items():
+            positions = [pos_of[i] for i in ids if i in pos_of]
+            if not positions:
+                continue
+            meta   = db.docstore.search(ids[0]).metadata
+            values = {"book_id": book_id, "author": meta.get("author"), "genre": meta.get("genre")}
+            for field, value in values.items():
+                fields[field].setdefault(value, []).extend(positions)
+
+        self.postings = {
+            field: {v: np.unique(np.asarray(p, dtype=np.int64)) for v, p in postings.items()}
+            for field, postings in fields.items()
+        }
+        if index_kind(db.index) == "ivf":
+            import faiss
+            faiss.extract_index_ivf(db.index).make_direct_map()
+
+    def books(self) -> list:
+        return sorted(self.postings["book_id"])
+
+    def _select(self, filters: dict):
+        """Positions matching every given filter, or None for the whole library."""
+        selected = None
+        for field, value in filters.items():
+            if value is None:
+                continue
+            positions = self.postings[field].get(value, np.empty(0, dtype=np.int64))
+            selected  = positions if selected is None else np.intersect1d(selected, positions)
+        return selected
+
+    def allowed_ids(self, book_id: str = None, author: str = None, genre: str = None):
+        """Docstore ids matching the filters (for the lexical side), or None for all."""
+        positions = self._select({"book_id": book_id, "author": author, "genre": genre})
+        if positions is None:
+            return None
+        return {self.db.index_to_docstore_id[int(p)] for p in positions}
+
+    def search(self, query: str, k: int = 4, book_id: str = None,
+               author: str = None, genre: str = None) -> list:
+        """Return [(docstore id, distance)] for the k nearest chunks matching the filters."""
+        qv        = np.asarray([self.db.embedding_function.embed_query(query)], dtype=np.float32)
+        index     = self.db.index
+        positions = self._select({"book_id": book_id, "author": author, "genre": genre})
+
+        if positions is None:
+            dist, ids = index.search(qv, k)
+            hits = zip(ids[0], dist[0])
+        elif len(positions) == 0:
+            return []
+        elif len(positions) <= EXACT_SUBSET_MAX:
+            # Small subset (one book, one author) — exact scan of just its vectors
+            vecs = index.reconstruct_batch(positions)
+            d    = ((vecs - qv) ** 2).sum(axis=1)
+            top  = np.argsort(d)[:k]
+            hits = zip(positions[top], d[top])
+        else:
+            dist, ids = index.search(qv, k, params=self._selector_params(positions))
+            hits = zip(ids[0], dist[0])
+
+        return [(self.db.index_to_docstore_id[int(pos)], float(d))
+                for pos, d in hits if pos >= 0]
+
+    def _selector_params(self, positions: np.ndarray):
+        import faiss
+
+        sel  = faiss.IDSelectorBatch(len(positions), faiss.swig_ptr(positions))
+        kind = index_kind(self.db.index)
+        if kind == "ivf":
+            return faiss.SearchParametersIVF(sel=sel, nprobe=IVF_NPROBE)
+        if kind == "hnsw":
+            return faiss.SearchParametersHNSW(sel=sel, efSearch=HNSW_EF_SEARCH)
+        return faiss.SearchParameters(sel=sel)
+
+
+_loaded      = {}
+_loaded_lock = threading.Lock()
+
+
+def get_library(embeddings):
+    """The current LibraryIndex, or None if the library hasn't been built."""
+    key = library_key()
+    if not key:
+        return None
+    db = get_index(key, embeddings)
+    with _loaded_lock:
+        lib = _loaded.get(key)
+        # Rebuild postings if the cache handed back a reloaded store
+        if lib is None or lib.db is not db:
+            lib = _loaded[key] = LibraryIndex(key, db)
+            for stale in [k for k in _loaded if k != key]:
+                del _loaded[stale]
+        return lib
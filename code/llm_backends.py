@@ -0,0 +1,194 @@
+# llm_backends.py — Pluggable chat-model backends with per-backend speed stats
+
+import os
+import threading
+import time
+
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.language_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+
+# Which backend answers questions: gemini | llamacpp | openai | stub
+LLM_BACKEND = os.getenv("BOOKCHAT_LLM_BACKEND", "gemini").lower()
+TEMPERATURE = float(os.getenv("BOOKCHAT_TEMPERATURE", "0.3"))
+
+GEMINI_MODEL     = os.getenv("BOOKCHAT_GEMINI_MODEL", "gemini-1.5-flash")
+LLAMA_MODEL_PATH = os.getenv("BOOKCHAT_LLAMA_MODEL_PATH", "models/model.gguf")
+LLAMA_THREADS    = int(os.getenv("BOOKCHAT_LLAMA_THREADS", str(os.cpu_count() or 4)))
+LLAMA_CTX        = int(os.getenv("BOOKCHAT_LLAMA_CTX", "8192"))
+OPENAI_BASE_URL  = os.getenv("BOOKCHAT_OPENAI_BASE_URL", "http://localhost:8080/v1")
+OPENAI_MODEL     = os.getenv("BOOKCHAT_OPENAI_MODEL", "local")
+
+_BACKENDS = {}      # name -> (factory, model id)
+
+
+def register_backend(name: str, model_id: str):
+    def wrap(factory):
+        _BACKENDS[name] = (factory, model_id)
+        return factory
+    return wrap
+
+
+@register_backend("gemini", GEMINI_MODEL)
+def _gemini(callbacks):
+    from langchain_google_genai import ChatGoogleGenerativeAI
+    return ChatGoogleGenerativeAI(model=GEMINI_MODEL, temperature=TEMPERATURE, callbacks=callbacks)
+
+
+@register_backend("llamacpp", os.path.basename(LLAMA_MODEL_PATH))
+def _llamacpp(callbacks):
+    # Needs llama-cpp-python; runs a GGUF model on the local CPU
+    from langchain_community.chat_models import ChatLlamaCpp
+    return ChatLlamaCpp(
+        model_path=LLAMA_MODEL_PATH,
+        n_threads=LLAMA_THREADS,
+        n_ctx=LLAMA_CTX,
+        temperature=TEMPERATURE,
+        streaming=True,
+        verbose=False,
+        callbacks=callbacks,
+    )
+
+
+@register_backend("openai", OPENAI_MODEL)
+def _openai_compatible(callbacks):
+    # Needs langchain-openai; any server speaking the OpenAI chat API
+    # (llama.cpp server, vLLM, Ollama, LM Studio …)
+    from langchain_openai import ChatOpenAI
+    return ChatOpenAI(
+        base_url=OPENAI_BASE_URL,
+        api_key=os.getenv("OPENAI_API_KEY", "not-needed"),
+        model=OPENAI_MODEL,
+        temperature=TEMPERATURE,
+        streaming=True,
+        callbacks=callbacks,
+    )
+
+
+class StubChatModel(BaseChatModel):
+    """Deterministic offline model for tests: echoes the question back, word by word."""
+
+    @property
+    def _llm_type(self) -> str:
+        return "bookchat-stub"
+
+    def _reply(self, messages) -> str:
+        prompt   = messages[-1].content if messages else ""
+        question = prompt.rsplit("Question:", 1)[-1].split("Answer:", 1)[0].strip()
+        return f"Stub answer to: {question or prompt[-80:].strip()}"
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=self._reply(messages)))])
+
+    def _stream(self, messages, stop=None, run_manager=None, **kwargs):
+        words = self._reply(messages).split(" ")
+        for n, word in enumerate(words):
+            piece = word if n == len(words) - 1 else word + " "
+            chunk = ChatGenerationChunk(message=AIMessageChunk(content=piece))
+            if run_manager:
+                run_manager.on_llm_new_token(piece, chunk=chunk)
+            yield chunk
+
+
+@register_backend("stub", "stub")
+def _stub(callbacks):
+    return StubChatModel(callbacks=callbacks)
+
+
+# =========================
+# SPEED STATS
+# Every call is timed by a callback: time to first token, and output
+# tokens per second over the generation (after the first token).
+# =========================
+
+class ThroughputMeter(BaseCallbackHandler):
+    run_inline = True       # time tokens on arrival, not from an executor
+
+    def __init__(self, backend: str):
+        self.backend = backend
+        self.calls   = 0
+        self.ttft    = 0.0       # summed over calls
+        self.tokens  = 0
+        self.gen_s   = 0.0
+        self._runs   = {}        # run_id -> [started, first_token_at, tokens]
+        self._lock   = threading.Lock()
+
+    def on_chat_model_start(self, serialized, messages, *, run_id, **kwargs):
+        self._runs[run_id] = [time.perf_counter(), None, 0]
+
+    on_llm_start = on_chat_model_start
+
+    def on_llm_new_token(self, token, *, run_id, **kwargs):
+        run = self._runs.get(run_id)
+        if run:
+            if run[1] is None:
+                run[1] = time.perf_counter()
+            run[2] += 1
+
+    def on_llm_end(self, response, *, run_id, **kwargs):
+        run = self._runs.pop(run_id, None)
+        if not run:
+            return
+        now          = time.perf_counter()
+        first        = run[1] or now
+        tokens       = run[2]
+        # Prefer the provider's own token count over streamed chunk count
+        try:
+            usage = response.generations[0][0].message.usage_metadata or {}
+            tokens = usage.get("output_tokens") or tokens
+        except (AttributeError, IndexError):
+            pass
+        with self._lock:
+            self.calls  += 1
+            self.ttft   += first - run[0]
+            self.tokens += tokens
+            self.gen_s  += now - first
+
+    def on_llm_error(self, error, *, run_id, **kwargs):
+        self._runs.pop(run_id, None)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "calls":          self.calls,
+                "ttft_ms":        1000 * self.ttft / self.calls if self.calls else 0.0,
+                "tokens_per_s":   self.tokens / self.gen_s if self.gen_s else 0.0,
+            }
+
+
+_meters      = {}
+_models      = {}
+_models_lock = threading.Lock()
+
+
+def _meter(name: str) -> ThroughputMeter:
+    return _meters.setdefault(name, ThroughputMeter(name))
+
+
+def backend_names() -> list:
+    return sorted(_BACKENDS)
+
+
+def backend_id(name: str = LLM_BACKEND) -> str:
+    """Backend and model, e.g. "gemini:gemini-1.5-flash" (part of the answer-cache key)."""
+    if name not in _BACKENDS:
+        raise ValueError(f"Unknown LLM backend: {name} (choose from {', '.join(backend_names())})")
+    return f"{name}:{_BACKENDS[name][1]}"
+
+
+def get_llm(name: str = LLM_BACKEND) -> BaseChatModel:
+    """
+    The named backend's chat model, instrumented with its speed meter.
+    Built once per process — a local GGUF model takes seconds to load.
+    """
+    backend_id(name)
+    with _models_lock:
+        if name not in _models:
+            _models[name] = _BACKENDS[name][0]([_meter(name)])
+        return _models[name]
+
+
+def backend_stats() -> dict:
+    """name -> {calls, ttft_ms, tokens_per_s} for every backend used in this process."""
+    return {name: m.stats() for name, m in _meters.items()}
@@ -0,0 +1,103 @@
+# mapped_docstore.py — Read-only docstore served from memory-mapped chunk files
+
+import bisect
+import json
+import mmap
+import os
+from collections.abc import Mapping
+
+import numpy as np
+from langchain_community.docstore.base import Docstore
+from langchain_core.documents import Document
+
+# Written beside index.faiss: one JSON record per chunk, in index position
+# order, plus .npy arrays that locate them without reading the rest
+CHUNKS_FILE   = "chunks.bin"
+OFFSETS_FILE  = "chunk_offsets.npy"    # int64, n + 1: record i is [offsets[i], offsets[i+1])
+IDS_FILE      = "chunk_ids.npy"        # docstore id at each position
+ID_ORDER_FILE = "chunk_id_order.npy"   # positions sorted by docstore id, for lookups
+MAPPED_FILES  = (CHUNKS_FILE, OFFSETS_FILE, IDS_FILE, ID_ORDER_FILE)
+
+
+def save_chunks(db, folder: str):
+    """Write db's chunks in index position order as the mapped files."""
+    n       = db.index.ntotal
+    ids     = [db.index_to_docstore_id[pos] for pos in range(n)]
+    offsets = np.zeros(n + 1, dtype=np.int64)
+    with open(os.path.join(folder, CHUNKS_FILE), "wb") as f:
+        for pos, doc_id in enumerate(ids):
+            doc    = db.docstore.search(doc_id)
+            record = json.dumps({"text": doc.page_content, "metadata": doc.metadata},
+                                ensure_ascii=False).encode("utf-8")
+            f.write(record)
+            offsets[pos + 1] = offsets[pos] + len(record)
+    ids = np.array(ids, dtype=str) if ids else np.zeros(0, dtype="<U1")
+    np.save(os.path.join(folder, OFFSETS_FILE), offsets)
+    np.save(os.path.join(folder, IDS_FILE), ids)
+    np.save(os.path.join(folder, ID_ORDER_FILE), np.argsort(ids, kind="stable").astype(np.int64))
+
+
+def has_mapped_chunks(folder: str) -> bool:
+    return all(os.path.exists(os.path.join(folder, name)) for name in MAPPED_FILES)
+
+
+class PositionIds(Mapping):
+    """index position → docstore id, read from the mapped ids array."""
+
+    def __init__(self, ids: np.ndarray):
+        self._ids = ids
+
+    def __getitem__(self, pos) -> str:
+        pos = int(pos)
+        if not 0 <= pos < len(self._ids):
+            raise KeyError(pos)
+        return str(self._ids[pos])
+
+    def __len__(self) -> int:
+        return len(self._ids)
+
+    def __iter__(self):
+        return iter(range(len(self._ids)))
+
+    def items(self):
+        return enumerate(self._ids.tolist())
+
+    def values(self):
+        return self._ids.tolist()
+
+
+class MappedDocstore(Docstore):
+    """
+    Documents decoded one at a time from chunks.bin, found by docstore id
+    through a binary search of the sorted-id order. Opening costs a few
+    mmaps whatever the index size, and the pages are shared by every
+    process that has the same index open.
+    """
+
+    def __init__(self, folder: str):
+        self.ids      = np.load(os.path.join(folder, IDS_FILE), mmap_mode="r")
+        self.offsets  = np.load(os.path.join(folder, OFFSETS_FILE), mmap_mode="r")
+        self.id_order = np.load(os.path.join(folder, ID_ORDER_FILE), mmap_mode="r")
+        with open(os.path.join(folder, CHUNKS_FILE), "rb") as f:
+            size     = os.fstat(f.fileno()).st_size
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if size else b""
+
+    def position(self, doc_id: str):
+        """Index position of this docstore id, or None."""
+        i = bisect.bisect_left(self.id_order, doc_id, key=lambda pos: self.ids[pos])
+        if i < len(self.id_order) and self.ids[self.id_order[i]] == doc_id:
+            return int(self.id_order[i])
+        return None
+
+    def document(self, pos: int) -> Document:
+        record = json.loads(self._mm[self.offsets[pos]:self.offsets[pos + 1]])
+        return Document(page_content=record["text"], metadata=record["metadata"], id=str(self.ids[pos]))
+
+    def search(self, search: str):
+        pos = self.position(search)
+        if pos is None:
+            return f"ID {search} not found."
+        return self.document(pos)
+
+    def index_to_docstore_id(self) -> PositionIds:
+        return PositionIds(self.ids)
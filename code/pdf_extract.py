@@ -0,0 +1,95 @@
+# pdf_extract.py — Parallel, page-streaming PDF text extraction
+
+import multiprocessing as mp
+import os
+import tempfile
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+from PyPDF2 import PdfReader
+
+PDF_WORKERS    = int(os.getenv("BOOKCHAT_PDF_WORKERS", str(max(1, (os.cpu_count() or 2) // 2))))
+PAGES_PER_TASK = 16
+
+# Below this many pages a pool costs more than it saves
+_SERIAL_PAGES = 2 * PAGES_PER_TASK
+
+
+def _extract_range(path: str, start: int, stop: int) -> list:
+    """Worker: extract pages [start, stop) → [(page_number, text), ...]."""
+    reader = PdfReader(path)
+    return [(n + 1, reader.pages[n].extract_text() or "") for n in range(start, stop)]
+
+
+def _spill_to_disk(pdf) -> str:
+    """Write an uploaded file to a temp path so workers can open it themselves."""
+    data = pdf.getvalue() if hasattr(pdf, "getvalue") else pdf.read()
+    fd, path = tempfile.mkstemp(suffix=".pdf")
+    with os.fdopen(fd, "wb") as f:
+        f.write(data)
+    return path
+
+
+def iter_pdf_pages(pdf_docs, progress=None,
+                   workers: int = PDF_WORKERS,
+                   pages_per_task: int = PAGES_PER_TASK):
+    """
+    Yield (file_name, page_number, text) for every page of every PDF, in order.
+
+    Page ranges are spread over a process pool, but only `2 * workers`
+    ranges are in flight at once, so memory stays bounded however long the
+    document is. progress(pages_done, total_pages, pages_per_sec) is called
+    after each range.
+    """
+    paths = [(getattr(pdf, "name", "document.pdf"), _spill_to_disk(pdf)) for pdf in pdf_docs]
+    try:
+        tasks = []
+        for name, path in paths:
+            n_pages = len(PdfReader(path).pages)
+            for start in range(0, n_pages, pages_per_task):
+                tasks.append((name, path, start, min(start + pages_per_task, n_pages)))
+
+        total   = sum(stop - start for _, _, start, stop in tasks)
+        done    = 0
+        started = time.perf_counter()
+
+        def report(n):
+            nonlocal done
+            done += n
+            if progress:
+                elapsed = max(time.perf_counter() - started, 1e-6)
+                progress(done, total, done / elapsed)
+
+        if workers <= 1 or total < _SERIAL_PAGES:
+            for name, path, start, stop in tasks:
+                pages = _extract_range(path, start, stop)
+                report(len(pages))
+                for n, text in pages:
+                    yield name, n, text
+            return
+
+        with ProcessPoolExecutor(max_workers=workers,
+                                 mp_context=mp.get_context("spawn")) as pool:
+            pending = deque()
+            task_iter = iter(tasks)
+            for task in task_iter:
+                pending.append((task[0], pool.submit(_extract_range, *task[1:])))
+                if len(pending) >= 2 * workers:
+                    break
+            while pending:
+                name, future = pending.popleft()
+                pages = future.result()
+                # Keep the window full
+                nxt = next(task_iter, None)
+                if nxt:
+                    pending.append((nxt[0], pool.submit(_extract_range, *nxt[1:])))
+                report(len(pages))
+                for n, text in pages:
+                    yield name, n, text
+    finally:
+        for _, path in paths:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
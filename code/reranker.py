@@ -0,0 +1,148 @@
+# reranker.py — Optional cross-encoder second stage over fused retrieval candidates
+
+import os
+import threading
+import time
+
+RERANK_ENABLED    = os.getenv("BOOKCHAT_RERANK", "0") == "1"
+RERANK_MODEL      = os.getenv("BOOKCHAT_RERANK_MODEL", "cross-encoder/ms-marco-MiniLM-L-6-v2")
+# Candidates over-fetched for reranking, and the time allowed to score them
+RERANK_CANDIDATES = int(os.getenv("BOOKCHAT_RERANK_CANDIDATES", "30"))
+RERANK_BUDGET_MS  = float(os.getenv("BOOKCHAT_RERANK_BUDGET_MS", "250"))
+
+# The cross-encoder reads at most 512 tokens of question + passage, so a
+# longer chunk is scored as windows of about this many characters (~400
+# tokens) and keeps the score of its best window
+RERANK_WINDOW_CHARS = int(os.getenv("BOOKCHAT_RERANK_WINDOW_CHARS", "1500"))
+
+# Weight of the newest measurement in the per-pair latency estimate
+_EWMA_ALPHA = 0.3
+# While the estimate says nothing fits, score just k candidates every this
+# many questions and take that as the new estimate, so one slow pass
+# doesn't switch reranking off for good
+_PROBE_EVERY = 20
+
+
+def _windows(text: str, size: int = RERANK_WINDOW_CHARS) -> list:
+    """Split text into windows of at most size characters, overlapping by a tenth."""
+    if len(text) <= size:
+        return [text]
+    step = size - size // 10
+    return [text[i:i + size] for i in range(0, len(text) - size // 10, step)]
+
+
+class Reranker:
+    """
+    Scores (question, passage window) pairs in one batched CPU forward pass
+    and keeps the best k passages. A running estimate of milliseconds per
+    pair decides how many candidates fit the latency budget: when the
+    machine is busy fewer are scored, and when not even k fit — or another
+    question is mid-rerank — reranking is skipped, apart from a k-candidate
+    probe every _PROBE_EVERY questions that keeps the estimate current.
+
+    A pass that outlives the pipeline's rerank deadline can't be
+    interrupted: its thread keeps the model lock until the pass ends, and
+    questions arriving meanwhile skip reranking rather than queue. Each pass
+    is sized to the budget, which is well under the deadline, so this only
+    happens when the estimate was badly stale — and the overrun is folded
+    into the estimate, shrinking the passes that follow.
+    """
+
+    def __init__(self, model_name: str = RERANK_MODEL, budget_ms: float = RERANK_BUDGET_MS):
+        self.model_name  = model_name
+        self.budget_ms   = budget_ms
+        self.ms_per_pair = None
+        self.calls       = 0
+        self.shrunk      = 0
+        self.skipped     = 0
+        self.probes      = 0
+        self._since_fit  = 0
+        self._probing    = False
+        self._model      = None
+        self._lock       = threading.Lock()
+
+    def _get_model(self):
+        if self._model is None:
+            from sentence_transformers import CrossEncoder
+            self._model = CrossEncoder(self.model_name, device="cpu", max_length=512)
+        return self._model
+
+    def warm_up(self, pairs: int = 8):
+        """
+        Load the model, run one pass, then time a batch of window-length
+        pairs, so the first question is neither charged for loading nor
+        planned without a latency estimate.
+        """
+        with self._lock:
+            model = self._get_model()
+            model.predict([("warm-up", "warm-up")], show_progress_bar=False)
+            passage = ("The quick brown fox jumps over the lazy dog. " * 64)[:RERANK_WINDOW_CHARS]
+            start   = time.perf_counter()
+            model.predict([("What did the fox do?", passage)] * pairs, batch_size=pairs,
+                          show_progress_bar=False)
+            self.ms_per_pair = 1000 * (time.perf_counter() - start) / pairs
+
+    def plan(self, pairs: list, k: int) -> int:
+        """
+        How many leading candidates to score, given each one's pair count;
+        0 means keep retrieval order.
+        """
+        self._probing = False
+        if self.ms_per_pair is None:
+            # Not calibrated (no warm_up): score just k, which also measures
+            return min(k, len(pairs))
+        fit, m = self.budget_ms / self.ms_per_pair, 0      # float: budget may be inf
+        while m < len(pairs) and pairs[m] <= fit:
+            fit -= pairs[m]
+            m   += 1
+        if m >= min(k, len(pairs)):
+            self._since_fit = 0
+            return m
+        self._since_fit += 1
+        if self._since_fit >= _PROBE_EVERY:
+            self._since_fit = 0
+            self._probing   = True
+            self.probes    += 1
+            return min(k, len(pairs))
+        return 0
+
+    def rerank(self, question: str, docs: list, k: int) -> list:
+        # Another question is already being reranked: don't queue behind it
+        if not self._lock.acquire(blocking=False):
+            self.skipped += 1
+            return docs[:k]
+        try:
+            windows = [_windows(d.page_content) for d in docs]
+            m = self.plan([len(w) for w in windows], k)
+            self.calls += 1
+            if m == 0:
+                self.skipped += 1
+                return docs[:k]
+            if m < len(docs):
+                self.shrunk += 1
+
+            pairs  = [(question, w) for ws in windows[:m] for w in ws]
+            model  = self._get_model()
+            start  = time.perf_counter()
+            flat   = model.predict(pairs, batch_size=len(pairs), show_progress_bar=False)
+            per_pair = 1000 * (time.perf_counter() - start) / len(pairs)
+            scores, at = [], 0
+            for ws in windows[:m]:
+                scores.append(max(float(x) for x in flat[at:at + len(ws)]))
+                at += len(ws)
+            self.ms_per_pair = (per_pair if self.ms_per_pair is None or self._probing
+                                else _EWMA_ALPHA * per_pair + (1 - _EWMA_ALPHA) * self.ms_per_pair)
+        finally:
+            self._lock.release()
+
+        order = sorted(range(m), key=lambda i: -scores[i])
+        return [docs[i] for i in order[:k]]
+
+    def stats(self) -> dict:
+        return {
+            "calls":       self.calls,
+            "shrunk":      self.shrunk,
+            "skipped":     self.skipped,
+            "probes":      self.probes,
+            "ms_per_pair": self.ms_per_pair or 0.0,
+        }
@@ -0,0 +1,43 @@
+# retrieval.py — Dense + lexical retrieval fused with reciprocal rank fusion
+
+import numpy as np
+
+# Candidates each retriever contributes before fusion
+FETCH_K = 20
+# Standard RRF damping constant
+RRF_K   = 60
+
+
+def dense_search(db, query: str, k: int = FETCH_K) -> list:
+    """[(docstore id, L2 distance)] nearest first, straight from the FAISS index."""
+    qv = np.asarray([db.embedding_function.embed_query(query)], dtype=np.float32)
+    dist, pos = db.index.search(qv, k)
+    return [(db.index_to_docstore_id[int(p)], float(d))
+            for p, d in zip(pos[0], dist[0]) if p >= 0]
+
+
+def reciprocal_rank_fusion(*rankings, k: int = 4, rrf_k: int = RRF_K) -> list:
+    """
+    Fuse ranked id lists: score(id) = Σ 1 / (rrf_k + rank). Only ranks
+    matter, so BM25 scores and L2 distances never need to be calibrated.
+    """
+    scores = {}
+    for ranking in rankings:
+        for rank, doc_id in enumerate(ranking, 1):
+            scores[doc_id] = scores.get(doc_id, 0.0) + 1.0 / (rrf_k + rank)
+    return sorted(scores, key=scores.get, reverse=True)[:k]
+
+
+def hybrid_search(db, lexical, query: str, k: int = 4,
+                  dense=None, allowed: set = None) -> list:
+    """
+    Top-k Documents by RRF over dense and BM25 rankings.
+    dense: precomputed [(id, score)] (e.g. from a filtered library search);
+    lexical may be None for indexes saved before it existed.
+    """
+    if dense is None:
+        dense = dense_search(db, query)
+    ranked = [[doc_id for doc_id, _ in dense]]
+    if lexical is not None:
+        ranked.append([doc_id for doc_id, _ in lexical.search(query, k=FETCH_K, allowed=allowed)])
+    return [db.docstore.search(doc_id) for doc_id in reciprocal_rank_fusion(*ranked, k=k)]
@@ -4,6 +4,8 @@ import streamlit as st
 import os
 from books import books, genres
 from gutenberg_search import search_gutenberg
+from index_store import delete_index
+from library_index import library_key
 
 # ── Cover colour palette (cycles through books) ─────────────────────────────
 COVER_COLORS = [
@@ -41,7 +43,7 @@ def load_css():
 
 # ─── SIDEBAR ─────────────────────────────────────────────────────────────────
 
-def sidebar_ui(get_pdf_text, get_text_chunks, get_vector_store):
+def sidebar_ui(index_pdfs, active_index_key, build_library, get_cache_stats, get_llm_stats):
     with st.sidebar:
 
         # Logo
@@ -120,13 +122,21 @@ def sidebar_ui(get_pdf_text, get_text_chunks, get_vector_store):
                 else:
                     with st.spinner("Processing…"):
                         try:
-                            raw    = get_pdf_text(pdf_docs)
-                            chunks = get_text_chunks(raw)
-                            get_vector_store(chunks)
+                            bar = st.progress(0.0, text="Reading pages…")
+
+                            def progress(done, total, rate):
+                                bar.progress(done / max(total, 1),
+                                             text=f"{done}/{total} pages · {rate:.0f} pages/s")
+
+                            # Start from the current upload's index so only new files are embedded
+                            ab   = st.session_state.get("active_book") or {}
+                            base = active_index_key() if ab.get("genre") == "Document" else None
+                            key  = index_pdfs(pdf_docs, progress=progress, base_key=base)
                             st.session_state.active_book = {
                                 "title": pdf_docs[0].name,
                                 "author": "Your Document",
                                 "emoji": "📄", "genre": "Document", "url": None,
+                                "index_key": key,
                             }
                             st.session_state.chat_history = []
                             st.session_state.page = "reader"
@@ -137,20 +147,52 @@ def sidebar_ui(get_pdf_text, get_text_chunks, get_vector_store):
 
         st.markdown("---")
 
+        # Library-wide index — lets the reader search across every catalogue book
+        lib_label = "📚 Update Library Index" if library_key() else "📚 Index Whole Library"
+        if st.button(lib_label, use_container_width=True, key="build_lib"):
+            bar = st.progress(0.0, text="Indexing library…")
+
+            def lib_progress(done, total, title):
+                bar.progress(done / max(total, 1), text=f"{done}/{total} · {title[:24]}")
+
+            try:
+                build_library(books, progress=lib_progress)
+                st.success("✅ Library indexed")
+            except Exception as e:
+                st.error(f"❌ {e}")
+
         if st.session_state.get("chat_history"):
             if st.button("🗑️ Clear Chat", use_container_width=True, key="clr_chat"):
                 st.session_state.chat_history = []
                 st.rerun()
 
-        if os.path.exists("faiss_index"):
+        if active_index_key():
             if st.button("🔄 Reset Index", use_container_width=True, key="rst_idx"):
-                import shutil
-                shutil.rmtree("faiss_index", ignore_errors=True)
+                delete_index(active_index_key())
                 st.session_state.active_book  = None
                 st.session_state.chat_history = []
                 st.session_state.page = "library"
                 st.rerun()
 
+        with st.expander("⚡ Cache hit rates"):
+            for name, s in get_cache_stats().items():
+                total = s["hits"] + s["misses"]
+                rate  = f"{100 * s['hits'] / total:.0f}%" if total else "—"
+                st.markdown(
+                    f"<div style='font-size:12px;color:#6b6880;'><b>{name}</b> · {rate} "
+                    f"<span style='color:#9d9aaa;'>({s['hits']}/{total})</span></div>",
+                    unsafe_allow_html=True,
+                )
+            for name, s in get_llm_stats().items():
+                if not s["calls"]:
+                    continue
+                st.markdown(
+                    f"<div style='font-size:12px;color:#6b6880;'><b>LLM · {name}</b> · "
+                    f"{s['ttft_ms']:.0f} ms to first token · {s['tokens_per_s']:.1f} tok/s "
+                    f"<span style='color:#9d9aaa;'>({s['calls']} calls)</span></div>",
+                    unsafe_allow_html=True,
+                )
+
         st.markdown("""
         <div style="padding:14px 4px 4px;text-align:center;">
             <div style="font-size:10px;color:#9d9aaa;line-height:2;">
@@ -299,8 +341,8 @@ def _render_askyourpdf_card(book: dict, idx: int, load_book_function):
         else:
             with st.spinner(f"📥 Loading {title}…"):
                 try:
-                    load_book_function(book["url"])
-                    st.session_state.active_book  = book
+                    key = load_book_function(book["url"])
+                    st.session_state.active_book  = {**book, "index_key": key}
                     st.session_state.chat_history = []
                     st.session_state.page = "reader"
                     st.rerun()
@@ -346,7 +388,7 @@ def search_page(load_book_function):
 
 # ─── SPLIT-SCREEN READER ─────────────────────────────────────────────────────
 
-def reader_page(ask_question_fn):
+def reader_page(stream_answer_fn, active_index_key, reject_cached_answer_fn, locate_passage_fn):
     book    = st.session_state.get("active_book") or {}
     history = st.session_state.get("chat_history", [])
 
@@ -365,7 +407,7 @@ def reader_page(ask_question_fn):
         return
 
     # Guard: index missing
-    if not os.path.exists("faiss_index"):
+    if not active_index_key():
         st.warning("⚠️ Book index was cleared. Please reload the book from the library.")
         if st.button("← Back to Library", key="no_idx_back"):
             st.session_state.page = "library"
@@ -378,14 +420,8 @@ def reader_page(ask_question_fn):
     idx    = _book_idx(book)
     bg     = _bg(idx)
 
-    # ── Fire suggested question stored from last rerun ──
-    if "_fire_q" in st.session_state:
-        q = st.session_state["_fire_q"]
-        del st.session_state["_fire_q"]
-        with st.spinner("Thinking…"):
-            ans = ask_question_fn(q)
-        # history is saved inside ask_question_fn; just rerun to render
-        st.rerun()
+    # ── Suggested question stored from last rerun — answered in the chat below ──
+    fired_q = st.session_state.pop("_fire_q", None)
 
     # ════════════════════════════════
     # SPLIT: chat LEFT  |  viewer RIGHT
@@ -418,6 +454,16 @@ def reader_page(ask_question_fn):
         </div>
         """, unsafe_allow_html=True)
 
+        # Search scope — only catalogue books can widen to the library
+        if library_key() and book.get("url"):
+            scopes = {"book": "This book", "author": "This author", "library": "Whole library"}
+            st.session_state.scope = st.radio(
+                "Search scope", list(scopes), format_func=scopes.get,
+                horizontal=True, label_visibility="collapsed", key="scope_radio",
+            )
+        else:
+            st.session_state.scope = "book"
+
         # Suggested questions (only before first message)
         if not history:
             suggestions = [
@@ -469,16 +515,28 @@ def reader_page(ask_question_fn):
                     st.write(history[-2][1])
                 with st.chat_message("assistant"):
                     st.write(history[-1][1])
+                timing = st.session_state.get("_last_timing")
+                if timing:
+                    caption = f"first token {timing['ttft']:.2f}s · full answer {timing['total']:.2f}s"
+                    if timing.get("context_tokens"):
+                        caption += f" · {timing['context_tokens']:,} context tokens"
+                    st.caption(caption)
+                _render_passage_links(book, title, locate_passage_fn)
+                # Answer reused from a similar earlier question — let the reader reject it
+                if st.session_state.get("_semantic_audit"):
+                    if st.button("↻ Not what I asked — answer fresh", key="reject_cached"):
+                        with st.spinner("Thinking…"):
+                            reject_cached_answer_fn()
+                        st.rerun()
 
         # Chat input
-        question = st.chat_input("Ask a question or Use @ to mention a document…")
+        question = st.chat_input("Ask a question or Use @ to mention a document…") or fired_q
         if question and question.strip():
             with st.chat_message("user"):
                 st.write(question)
-            with st.spinner("Thinking…"):
-                ans = ask_question_fn(question)
+            # Tokens render as they arrive; history is saved inside stream_answer_fn
             with st.chat_message("assistant"):
-                st.write(ans)
+                st.write_stream(stream_answer_fn(question))
             st.rerun()
 
     # ━━━━━━━━━━━━━━ RIGHT: BOOK VIEWER ━━━━━━━━━━━━━━
@@ -569,33 +627,53 @@ def _generate_pdf_bytes(book_text: str, title: str, author: str) -> bytes:
     return buf.getvalue()
 
 
+def _batch_key(title: str) -> str:
+    return f"book_batch_{title[:20].replace(' ','_')}"
+
+
+def _render_passage_links(book: dict, title: str, locate_passage_fn):
+    """"Show in book" buttons for the passages behind the last answer."""
+    sources = [m for m in st.session_state.get("_last_sources") or []
+               if m.get("source") == book.get("url") and m.get("start") is not None]
+    if not sources:
+        return
+    cols = st.columns(len(sources))
+    for n, (col, meta) in enumerate(zip(cols, sources)):
+        label = meta.get("chapter_title") or (f"Chapter {meta['chapter']}" if meta.get("chapter") else "Opening")
+        with col:
+            if st.button(f"📍 {label[:24]}", key=f"passage_{n}", use_container_width=True,
+                         help="Show where this passage is in the book"):
+                where = locate_passage_fn(meta)
+                if where:
+                    st.session_state[_batch_key(title)]           = where["batch"]
+                    st.session_state[f"{_batch_key(title)}_page"] = where["page"]
+                    st.rerun()
+
+
 def _render_book_viewer(book: dict, bg: str, title: str, author: str, emoji: str):
     """Right panel: continuous scrolling book reader — all pages stacked vertically."""
-    import re as _re
     import base64
     from io import BytesIO
 
     url = book.get("url", "")
 
     # ── State key for which batch (section) we're in ─────────────────────────
-    batch_key = f"book_batch_{title[:20].replace(' ','_')}"
+    batch_key = _batch_key(title)
     if batch_key not in st.session_state:
         st.session_state[batch_key] = 0
+    # Page to scroll to, set by "show in book" — only for this render
+    jump_page = st.session_state.pop(f"{batch_key}_page", None)
 
-    # ── Load book text from disk ─────────────────────────────────────────────
+    # ── Open book text from disk (memory-mapped; slices decode on demand) ─────
     book_text = None
     try:
-        from book_loader import get_book_text_by_url, get_book_text
+        from book_loader import open_book_text
         if url:
-            book_text = get_book_text_by_url(url, max_chars=None)
-        if not book_text and url:
-            ids = _re.findall(r"\d+", url)
-            if ids:
-                book_text = get_book_text(ids[0])
+            book_text = open_book_text(url)
     except Exception:
         pass
 
-    CHARS_PER_BATCH = 40_000
+    from book_renderer import CHARS_PER_BATCH
 
     # ── Toolbar ──────────────────────────────────────────────────────────────
     batch_idx     = st.session_state[batch_key]
@@ -621,14 +699,22 @@ def _render_book_viewer(book: dict, bg: str, title: str, author: str, emoji: str
     # ── Download bar (shown whenever book text is available) ─────────────────
     if book_text:
         safe_title = title.replace(" ", "_").replace("/", "-")[:40]
-        word_count = len(book_text.split())
+        # Counting words needs the whole text — once per session, not per rerun
+        words_key = f"_word_count_{safe_title}"
+        if words_key not in st.session_state:
+            st.session_state[words_key] = len(book_text[:].split())
+        word_count = st.session_state[words_key]
 
         dl_txt_col, dl_pdf_col, dl_info_col = st.columns([1, 1, 2])
 
         with dl_txt_col:
+            # raw_bytes() inflates every frame of a compressed book — once per session
+            txt_cache_key = f"_txt_bytes_{safe_title}"
+            if txt_cache_key not in st.session_state:
+                st.session_state[txt_cache_key] = book_text.raw_bytes()
             st.download_button(
                 label="📥 Download TXT",
-                data=book_text.encode("utf-8"),
+                data=st.session_state[txt_cache_key],
                 file_name=f"{safe_title}.txt",
                 mime="text/plain",
                 use_container_width=True,
@@ -643,7 +729,7 @@ def _render_book_viewer(book: dict, bg: str, title: str, author: str, emoji: str
                 with st.spinner("Building PDF…"):
                     try:
                         st.session_state[pdf_cache_key] = _generate_pdf_bytes(
-                            book_text, title, author
+                            book_text[:], title, author
                         )
                     except Exception:
                         st.session_state[pdf_cache_key] = None
@@ -690,12 +776,12 @@ def _render_book_viewer(book: dict, bg: str, title: str, author: str, emoji: str
         import streamlit.components.v1 as components
 
         pages_html = ""
-        for img in images:
+        for page_idx, img in enumerate(images):
             buf = BytesIO()
             img.save(buf, format="PNG", optimize=True)
             b64 = base64.b64encode(buf.getvalue()).decode()
             pages_html += (
-                "<div style='margin:0 auto 18px auto;max-width:100%;"
+                f"<div id='page-{page_idx}' style='margin:0 auto 18px auto;max-width:100%;"
                 "box-shadow:0 4px 20px rgba(0,0,0,0.22),-2px 0 6px rgba(0,0,0,0.06);"
                 "border-radius:2px;overflow:hidden;border:1px solid #ccc5b0;background:#faf8f3;'>"
                 f"<img src='data:image/png;base64,{b64}' style='width:100%;display:block;'/></div>"
@@ -707,7 +793,10 @@ def _render_book_viewer(book: dict, bg: str, title: str, author: str, emoji: str
             "<div style='background:#d6d0c4;padding:16px 10px 10px;height:660px;"
             "overflow-y:scroll;overflow-x:hidden;scroll-behavior:smooth;box-sizing:border-box;'>"
             + pages_html +
-            "</div></body></html>"
+            "</div>"
+            + (f"<script>document.getElementById('page-{jump_page}')"
+               ".scrollIntoView({block:'start'});</script>" if jump_page is not None else "")
+            + "</body></html>"
         )
         components.html(scrollable, height=680, scrolling=False)
 